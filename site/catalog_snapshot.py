@@ -0,0 +1,251 @@
+"""
+Immutable binary snapshot of course data, memory-mapped so that worker processes share it
+"""
+
+from array import array
+from bisect import bisect_right
+import argparse
+import json
+import mmap
+import os
+import struct
+import sqlite_db
+
+SNAPSHOT_FILE = 'catalog.snapshot'
+
+# File starts with magic bytes, a marker of the byte order it was written with, the catalog version,
+# then (offset, length) in bytes of each section, all of which except text sections are arrays of unsigned 32-bit integers
+MAGIC = b'CATSNAP1'
+BYTE_ORDER_MARKER = 0x01020304
+SECTIONS = ('string_offsets', # strings[string_offsets[i]:string_offsets[i + 1]] is string i
+            'strings', # UTF-8 encoded strings, each distinct string stored once
+            'course_ids', # String of course id of each course, sorted by course id
+            'course_id_list', # Course ids separated by newlines, so that lists of courses are decoded at once
+            'course_names',
+            'course_descriptions',
+            'course_links',
+            'course_prereqs', # String of prerequisites JSON of each course
+            'field_offsets', # field_names[field_offsets[i]:field_offsets[i + 1]] are fields of course i
+            'field_names',
+            'field_values',
+            'prereq_offsets', # prereq_targets[prereq_offsets[i]:prereq_offsets[i + 1]] are prerequisite courses of course i
+            'prereq_targets',
+            'postreq_offsets', # postreq_targets[postreq_offsets[i]:postreq_offsets[i + 1]] are postrequisite courses of course i
+            'postreq_targets')
+HEADER_FORMAT = '=8sIq' + 'QQ' * len(SECTIONS)
+NONE = 0xFFFFFFFF # String index of missing values
+
+
+class CatalogSnapshot:
+    def __init__(self, snapshot_file):
+        """Maps snapshot file into memory, where arrays are read in place instead of being copied"""
+        with open(snapshot_file, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, byte_order, self.version, *sections = struct.unpack_from(HEADER_FORMAT, self._mmap)
+        if magic != MAGIC or byte_order != BYTE_ORDER_MARKER:
+            self._mmap.close()
+            raise ValueError(f"{snapshot_file} is not a catalog snapshot of this machine")
+
+        self._view = memoryview(self._mmap)
+        self._sections = dict()
+        for name, offset, length in zip(SECTIONS, sections[0::2], sections[1::2]):
+            section = self._view[offset:offset + length]
+            self._sections[name] = section if name in ('strings', 'course_id_list') else section.cast('I')
+        self._strings = self._sections['strings']
+        self._string_offsets = self._sections['string_offsets']
+        self._course_ids = self._sections['course_ids']
+        self._course_list = None # Decoded course ids in sorted order, decoded the first time they are listed
+
+    def close(self):
+        """Unmaps snapshot, after which it can no longer be read"""
+        # Views into the mapping have to be released before it can be closed
+        for section in self._sections.values():
+            section.release()
+        self._view.release()
+        self._mmap.close()
+
+    def __len__(self):
+        return len(self._course_ids)
+
+    def _get_string(self, index):
+        """Returns string with index in string table, or None if index is NONE"""
+        if index == NONE:
+            return None
+        return str(self._strings[self._string_offsets[index]:self._string_offsets[index + 1]], 'utf-8')
+
+    def _get_course_id(self, index):
+        return self._get_string(self._course_ids[index])
+
+    def _find_course(self, course):
+        """Returns index of course found by binary search over course ids, or None if course not in snapshot"""
+        # UTF-8 bytes sort in the same order as strings, so ids are compared without decoding them
+        course = course.encode('utf-8')
+        strings, offsets, course_ids = self._strings, self._string_offsets, self._course_ids
+        low, high = 0, len(course_ids)
+        while low < high:
+            middle = (low + high) // 2
+            if strings[offsets[course_ids[middle]]:offsets[course_ids[middle] + 1]].tobytes() < course:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(course_ids) and strings[offsets[course_ids[low]]:offsets[course_ids[low] + 1]].tobytes() == course:
+            return low
+
+    def _get_range(self, offsets, targets, index):
+        return targets[offsets[index]:offsets[index + 1]]
+
+    ### Same results as the SqlDb getters of the same name
+    def get_courses(self, limit=-1, after=None):
+        if (courses := self._course_list) is None:
+            courses = self._course_list = str(self._sections['course_id_list'], 'utf-8').split('\n') if len(self._course_ids) else []
+        # Only the requested range is copied, starting at the first course id sorted after after
+        start = 0 if after is None else bisect_right(courses, after)
+        return courses[start:] if limit < 0 else courses[start:start + limit]
+
+    def _get_course_info(self, index):
+        return {"name": self._get_string(self._sections['course_names'][index]),
+                "description": self._get_string(self._sections['course_descriptions'][index]),
+                "link": self._get_string(self._sections['course_links'][index])
+               }
+
+    def get_course_basic_info(self, course):
+        if (index := self._find_course(course)) is not None:
+            return self._get_course_info(index)
+
+    def get_course_full_info(self, course):
+        if (index := self._find_course(course)) is not None:
+            info = self._get_course_info(index)
+            offsets = self._sections['field_offsets']
+            names = self._sections['field_names'][offsets[index]:offsets[index + 1]]
+            values = self._sections['field_values'][offsets[index]:offsets[index + 1]]
+            info["fields"] = [{"name": self._get_string(name),
+                               "value": self._get_string(value)
+                              } for name, value in zip(names, values)]
+            return info
+
+    def get_course_prereqs(self, course):
+        if (index := self._find_course(course)) is not None and (prereqs := self._sections['course_prereqs'][index]) != NONE:
+            return json.loads(self._get_string(prereqs))
+
+    def get_all_course_prereqs(self):
+        return [(self._get_course_id(i), json.loads(self._get_string(prereqs)))
+                for i, prereqs in enumerate(self._sections['course_prereqs']) if prereqs != NONE]
+
+    def get_prereq_courses(self, course):
+        if (index := self._find_course(course)) is None:
+            return []
+        return [self._get_course_id(i) for i in self._get_range(self._sections['prereq_offsets'], self._sections['prereq_targets'], index)]
+
+    def get_postreq_courses(self, course):
+        if (index := self._find_course(course)) is None:
+            return []
+        return [self._get_course_id(i) for i in self._get_range(self._sections['postreq_offsets'], self._sections['postreq_targets'], index)]
+
+    def get_requisite_edges(self):
+        return [(self._get_course_id(postreq), self._get_course_id(prereq)) for postreq in range(len(self._course_ids))
+                for prereq in self._get_range(self._sections['prereq_offsets'], self._sections['prereq_targets'], postreq)]
+
+
+def _compress(size, edges):
+    """Returns (offsets, targets) arrays, where targets[offsets[i]:offsets[i + 1]] are the sorted neighbours of i"""
+    offsets = array('I', [0] * (size + 1))
+    targets = array('I')
+    for source, target in sorted(edges):
+        offsets[source + 1] += 1
+        targets.append(target)
+    for i in range(size):
+        offsets[i + 1] += offsets[i]
+    return offsets, targets
+
+def export_snapshot(db, snapshot_file=SNAPSHOT_FILE):
+    """Writes course data of database to snapshot file, replacing it atomically so that open snapshots stay valid.
+    Returns size of snapshot in bytes
+    """
+    # Read everything in one transaction, so that snapshot matches the version it is stamped with
+    with db.transaction():
+        version = db.get_catalog_version()[1]
+        courses = sorted(db._execute_read(sqlite_db.GET_ALL_COURSES).fetchall())
+        fields = sorted(db._execute_read(sqlite_db.GET_ALL_COURSE_FIELDS).fetchall())
+        prereqs = dict(db._execute_read(sqlite_db.GET_ALL_COURSE_PREREQS).fetchall())
+        edges = db.get_requisite_edges()
+
+    # String table, with each distinct string stored once
+    string_index = dict()
+    strings = bytearray()
+    string_offsets = array('I', [0])
+    def intern(string):
+        if string is None:
+            return NONE
+        if (index := string_index.get(string)) is None:
+            index = string_index[string] = len(string_offsets) - 1
+            strings.extend(string.encode('utf-8'))
+            string_offsets.append(len(strings))
+        return index
+
+    course_index = {row[0]: i for i, row in enumerate(courses)}
+    sections = {'course_ids': array('I', [intern(row[0]) for row in courses]),
+                'course_id_list': '\n'.join(row[0] for row in courses).encode('utf-8'),
+                'course_names': array('I', [intern(row[1]) for row in courses]),
+                'course_descriptions': array('I', [intern(row[2]) for row in courses]),
+                'course_links': array('I', [intern(row[3]) for row in courses]),
+                'course_prereqs': array('I', [intern(prereqs.get(row[0])) for row in courses])}
+    field_counts = [0] * len(courses)
+    for course, _, _ in fields:
+        field_counts[course_index[course]] += 1
+    sections['field_offsets'] = array('I', [0])
+    for count in field_counts:
+        sections['field_offsets'].append(sections['field_offsets'][-1] + count)
+    sections['field_names'] = array('I', [intern(name) for _, name, _ in fields])
+    sections['field_values'] = array('I', [intern(value) for _, _, value in fields])
+    # Relations always refer to existing courses, since they reference Course
+    edges = [(course_index[postreq], course_index[prereq]) for postreq, prereq in edges]
+    sections['prereq_offsets'], sections['prereq_targets'] = _compress(len(courses), edges)
+    sections['postreq_offsets'], sections['postreq_targets'] = _compress(len(courses), [(prereq, postreq) for postreq, prereq in edges])
+    sections['string_offsets'] = string_offsets
+    sections['strings'] = strings
+
+    # Sections are aligned to 8 bytes, so that arrays can be read in place
+    header_size = struct.calcsize(HEADER_FORMAT)
+    offset = header_size
+    layout = []
+    data = []
+    for name in SECTIONS:
+        section = sections[name].tobytes() if type(sections[name]) == array else bytes(sections[name])
+        padding = -offset % 8
+        offset += padding
+        layout += [offset, len(section)]
+        data += [b'\0' * padding, section]
+        offset += len(section)
+
+    temp_file = f"{snapshot_file}.tmp"
+    with open(temp_file, 'wb') as f:
+        f.write(struct.pack(HEADER_FORMAT, MAGIC, BYTE_ORDER_MARKER, version, *layout))
+        for part in data:
+            f.write(part)
+    os.replace(temp_file, snapshot_file)
+    return offset
+
+def open_snapshot(snapshot_file=SNAPSHOT_FILE):
+    """Returns snapshot in file, or None if there is no valid snapshot"""
+    try:
+        return CatalogSnapshot(snapshot_file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, struct.error) as e:
+        print(f"Catalog snapshot {snapshot_file} not loaded: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exports course data into a memory-mapped catalog snapshot")
+    parser.add_argument('-o', '--output', default=SNAPSHOT_FILE, help="Snapshot file to write")
+    parser.add_argument('--db', default=sqlite_db.CATALOG_FILE, help="Catalog database file containing course data")
+    args = parser.parse_args()
+
+    db = sqlite_db.SqlDb(args.db)
+    size = export_snapshot(db, args.output)
+    print(f"Wrote {size} bytes of course data (version {db.get_catalog_version()[1]}) to {args.output}")
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Process-wide in-memory index of course codes for prefix lookups
+"""
+
+from bisect import bisect_left
+import sys
+import threading
+
+
+class CourseIndex:
+    def __init__(self, version, courses):
+        """Sorts course codes, so that codes starting with the same prefix are next to each other"""
+        self.version = version # Catalog version stamp the index was built from
+        self.courses = sorted(sys.intern(course.upper()) for course in courses)
+
+    def __len__(self):
+        return len(self.courses)
+
+    def _generate_prefix(self, prefix):
+        """Generator object for course codes starting with prefix, in sorted order"""
+        for i in range(bisect_left(self.courses, prefix), len(self.courses)):
+            if not self.courses[i].startswith(prefix):
+                break
+            yield self.courses[i]
+
+    def suggest(self, prefix, departments=None, limit=None):
+        """Returns sorted list of up to limit course codes starting with prefix,
+        only including courses of departments (e.g. 'MAT') if given
+        """
+        prefix = prefix.upper()
+        if departments is None:
+            prefixes = [prefix]
+        else:
+            # Each department is its own range of codes, narrowed further by prefix if it is longer than the department
+            prefixes = []
+            for department in sorted({department.upper() for department in departments}):
+                if prefix.startswith(department):
+                    prefixes.append(prefix)
+                elif department.startswith(prefix):
+                    prefixes.append(department)
+            # Ranges of prefixes that start with another prefix are already covered by it
+            prefixes = [p for p in sorted(set(prefixes)) if not any(p != q and p.startswith(q) for q in prefixes)]
+
+        suggestions = []
+        for department_prefix in prefixes:
+            for course in self._generate_prefix(department_prefix):
+                if limit is not None and len(suggestions) >= limit:
+                    return suggestions
+                suggestions.append(course)
+        return suggestions
+
+
+# Index of most recently used catalog, shared by all requests of the process
+_index = None
+_index_lock = threading.Lock()
+
+def get_course_index(db):
+    """Returns course code index of database, rebuilding it if course data has changed since it was built"""
+    global _index
+    version = db.get_catalog_version()
+    with _index_lock:
+        if _index is None or _index.version != version:
+            _index = CourseIndex(version, db.get_courses())
+        return _index
@@ -1,12 +1,69 @@
 from bs4 import BeautifulSoup as Soup
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from itertools import islice
+import argparse
 import json
+import time
 
 INPUT_FILENAME = "course-list.html"
 OUTPUT_FILENAME = "courses.json"
+READ_SIZE = 65536 # Number of characters of HTML read at a time in streaming mode
+CHUNK_SIZE = 64 # Number of courses sent to a worker process at a time
+BATCH_CHUNKS = 4 # Number of chunks per worker read ahead of courses being written in streaming mode
 
-def get_courses():
+class CourseRowParser(HTMLParser):
+    # Collects HTML of each course element while document is fed to it in pieces, without building a tree of the document
+    def __init__(self):
+        # Character references are kept as they are, so that fragments are the same HTML as the document
+        super().__init__(convert_charrefs=False)
+        self.fragments = [] # HTML of course elements completed so far
+        self._parts = [] # HTML of course element being read
+        self._depth = 0 # Number of div elements open inside course element, 0 if not inside one
+
+    def handle_starttag(self, tag, attrs):
+        if self._depth == 0:
+            if tag == 'div' and 'views-row' in (dict(attrs).get('class') or '').split():
+                self._parts = [self.get_starttag_text()]
+                self._depth = 1
+            return
+        self._parts.append(self.get_starttag_text())
+        # Only divs are counted, since other elements such as <br> and <p> are not always closed
+        if tag == 'div':
+            self._depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        if self._depth > 0:
+            self._parts.append(self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        if self._depth == 0:
+            return
+        self._parts.append(f"</{tag}>")
+        if tag == 'div':
+            self._depth -= 1
+            if self._depth == 0:
+                self.fragments.append(''.join(self._parts))
+
+    def handle_data(self, data):
+        if self._depth > 0:
+            self._parts.append(data)
+
+    def handle_entityref(self, name):
+        if self._depth > 0:
+            self._parts.append(f"&{name};")
+
+    def handle_charref(self, name):
+        if self._depth > 0:
+            self._parts.append(f"&#{name};")
+
+    def handle_comment(self, data):
+        if self._depth > 0:
+            self._parts.append(f"<!--{data}-->")
+
+def get_courses(input_filename=INPUT_FILENAME):
     # Returns list of elements containing course information
-    with open(INPUT_FILENAME, 'r', encoding='utf-8') as f:
+    with open(input_filename, 'r', encoding='utf-8') as f:
         document = Soup(f, 'html.parser')
     # Get element whose children contain information about each course
     courses = document.find(attrs={'class': 'view-content'})
@@ -71,11 +128,62 @@ def get_course_info(element):
 
     return info
 
+def generate_course_fragments(file, read_size=READ_SIZE):
+    # Generator object for HTML of each course element in file, read incrementally instead of loading entire file
+    parser = CourseRowParser()
+    while chunk := file.read(read_size):
+        parser.feed(chunk)
+        fragments, parser.fragments = parser.fragments, []
+        yield from fragments
+    parser.close()
+    yield from parser.fragments
+
+def get_fragment_info(fragment):
+    # Returns course information of HTML of a single course element
+    return get_course_info(Soup(fragment, 'html.parser').div)
+
+def generate_parallel(function, iterable, workers):
+    # Generator object for results of function applied to items of iterable by worker processes, in order
+    # Items are sent in batches, so that only a bounded number of them are held in memory at once
+    with ProcessPoolExecutor(workers) as executor:
+        while batch := list(islice(iterable, workers * CHUNK_SIZE * BATCH_CHUNKS)):
+            yield from executor.map(function, batch, chunksize=CHUNK_SIZE)
+
+def stream_courses(input_filename, output_filename, workers=1, ndjson=False):
+    # Writes information of each course in input file to output file as soon as it is parsed, one course per line,
+    # either as newline-delimited JSON or as a JSON array in the same format as main. Returns number of courses written
+    count = 0
+    with open(input_filename, 'r', encoding='utf-8') as input_file, open(output_filename, 'w') as output_file:
+        fragments = generate_course_fragments(input_file)
+        courses = map(get_fragment_info, fragments) if workers == 1 else generate_parallel(get_fragment_info, fragments, workers)
+        for course in courses:
+            if not ndjson:
+                output_file.write(',' if count > 0 else '[')
+            output_file.write(json.dumps(course) + '\n')
+            count += 1
+        if not ndjson:
+            output_file.write(']' if count > 0 else '[]')
+    return count
+
 def main():
-    courses = get_courses()
-    courses_info = [get_course_info(course) for course in courses]
-    with open(OUTPUT_FILENAME, 'w') as file:
-        json.dump(courses_info, file)
+    parser = argparse.ArgumentParser(description="Parses course information from UTSC calendar HTML into JSON file")
+    parser.add_argument('-i', '--input', default=INPUT_FILENAME, help="HTML file containing list of courses")
+    parser.add_argument('-o', '--output', default=OUTPUT_FILENAME, help="JSON file to write course information to")
+    parser.add_argument('-s', '--stream', action='store_true', help="Parse courses one at a time instead of loading entire document")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="Number of worker processes parsing courses in streaming mode")
+    parser.add_argument('--ndjson', action='store_true', help="Write one JSON object per line instead of JSON array in streaming mode")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.stream:
+        count = stream_courses(args.input, args.output, args.workers, args.ndjson)
+    else:
+        courses = get_courses(args.input)
+        courses_info = [get_course_info(course) for course in courses]
+        with open(args.output, 'w') as file:
+            json.dump(courses_info, file)
+        count = len(courses_info)
+    print(f"Parsed {count} courses in {time.perf_counter() - start:.2f}s")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
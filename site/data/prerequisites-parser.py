@@ -1,12 +1,77 @@
 # Parses prerequisites from course information file into json file
 
 import pyparsing as pp
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import hashlib
 import json
+import os
+import re
+import time
 
-# pp.ParserElement.enablePackrat()
+# Memoizes partial matches of the grammar, which infix_notation otherwise retries at every precedence level
+pp.ParserElement.enable_packrat()
 
 INPUT_FILENAME = 'courses.json'
 OUTPUT_FILENAME = 'prerequisites.json'
+FAILURES_FILENAME = 'prerequisites-failures.json' # Report of prerequisites that could not be parsed
+CACHE_FILENAME = 'prerequisites-cache.json' # Results of previous runs, so that only changed prerequisites are parsed again
+# Increment whenever preprocessing or grammar changes, so that results cached by older versions are parsed again
+GRAMMAR_VERSION = 1
+CHUNK_SIZE = 32 # Number of courses sent to a worker process at a time
+
+### Expression Keywords
+# Operators
+AND = pp.Keyword('and')
+OR = pp.Keyword('or')
+
+# UTSC Course Code
+COURSE_CODE = pp.Regex("\\(?[A-Z]{4}[0-9]{2}H3\.?\\)?")
+# Other campus course codes
+COURSE_CODE_EXTERN = pp.Regex("\\(?[A-Z]{3}[0-9]{3}(?:(?:H[13]?)|Y)\.?\\)?")
+# Grade 12 Courses
+COURSE_GRADE_12 = pp.Literal("Grade 12 Calculus and Vectors") | pp.Literal("one other Grade 12 mathematics course") | pp.Literal("Grade 12 Advanced Functions and Introductory Calculus and Geometry and Discrete Mathematics")
+# Program requirements
+OTHER_REQ = pp.Literal("proficiency in C") | pp.Literal("Some experience with programming in an imperative language such as Python, Java or C") | pp.Literal("Three C-level CSC courses") | pp.Literal("at least one other B-level course in Mathematics or Computer Science") | pp.Literal("1.5 credits at the C-level in MAT courses")
+CREDITS_REQ = pp.Regex("[0-9]+.[0-9]+ [Cc]redits?")
+CGPA_REQ = pp.Regex("(?:a )?CGPA (?:of (?:at least )?)?[0-9].[0-9],?")
+SUBJECT_ENROLLMENT_REQ = pp.Regex("enrolment in a (?:(?:CSC)|(?:Computer Science)|(?:Mathematics)) [Ss]ubject POSt,?")
+NON_SUBJECT_ENROLLMENT_REQ = pp.Regex("enrolment in a non-CSC Subject PO[Ss]t for which this specific course is a program requirement,?")
+PROGRAM_REQ = OTHER_REQ | CREDITS_REQ | CGPA_REQ | SUBJECT_ENROLLMENT_REQ | NON_SUBJECT_ENROLLMENT_REQ
+# Everything before a list of prerequisites
+PREAMBLE = pp.Regex(".*:") | pp.Regex("including,?")
+# Permission to take course
+PERMISSION = pp.Literal("Students must obtain consent from the Supervisor of Studies before registering for this course.") | pp.Literal("Permission of the instructor") | pp.Literal("permission of the Supervisor of Studies")
+
+### Actions to create prerequisite dictionary and replace unneeded prerequisites with empty strings
+COURSE_CODE.set_parse_action(lambda m: m[0].strip('(). '))
+COURSE_CODE_EXTERN.set_parse_action(lambda _: '')
+COURSE_GRADE_12.set_parse_action(lambda _: '')
+PROGRAM_REQ.set_parse_action(lambda _: '')
+PREAMBLE.set_parse_action(lambda _: '')
+PERMISSION.set_parse_action(lambda _: '')
+
+### Fast Path
+# Strings that are only course codes joined by a single operator are split into codes without the grammar.
+# Same course code and whitespace as the grammar, so that both give identical results
+SIMPLE_COURSE_CODE = "\\(?[A-Z]{4}[0-9]{2}H3\\.?\\)?"
+SIMPLE_WHITESPACE = "[ \\t\\r\\n]"
+SIMPLE_OR_LIST = re.compile(f"{SIMPLE_WHITESPACE}*{SIMPLE_COURSE_CODE}(?:(?:{SIMPLE_WHITESPACE}*/{SIMPLE_WHITESPACE}*|{SIMPLE_WHITESPACE}+or{SIMPLE_WHITESPACE}+){SIMPLE_COURSE_CODE})*{SIMPLE_WHITESPACE}*")
+SIMPLE_AND_LIST = re.compile(f"{SIMPLE_WHITESPACE}*{SIMPLE_COURSE_CODE}(?:{SIMPLE_WHITESPACE}+and{SIMPLE_WHITESPACE}+{SIMPLE_COURSE_CODE})*{SIMPLE_WHITESPACE}*")
+SIMPLE_TOKEN = re.compile(SIMPLE_COURSE_CODE)
+
+# Grammar is built once when module is imported, instead of for every prerequisite string
+OPERAND = COURSE_CODE | COURSE_CODE_EXTERN | COURSE_GRADE_12 | PROGRAM_REQ | PERMISSION
+EXPRESSION = pp.infix_notation(
+    OPERAND,
+    [
+        (AND, 2, pp.opAssoc.LEFT, lambda m: {'op': 'and', 'args': m[0][0::2]}),
+        (OR, 2, pp.opAssoc.LEFT, lambda m: {'op': 'or', 'args': m[0][0::2]}),
+        (PREAMBLE, 1, pp.opAssoc.RIGHT, lambda m: m[0][1])
+    ],
+    lpar='[',
+    rpar=']'
+).set_name("boolean expression")
 
 def get_courses(input_filename):
     with open(input_filename, 'r') as file:
@@ -14,7 +79,30 @@ def get_courses(input_filename):
     return courses
 
 def parse_prerequisites(prereq_str):
-    # Parses prereq_str and returns prerequistes in dictionary or as string. Returns original string if unsuccessfully parsed
+    # Parses prereq_str and returns prerequistes in dictionary or as string. Raises pp.ParseException if unsuccessfully parsed
+    # Only strings which are not a single course code or list of course codes are parsed with the grammar
+    matched, prereqs = parse_simple_prerequisites(prereq_str)
+    if matched:
+        return prereqs
+    return parse_prerequisites_grammar(prereq_str)
+
+def parse_simple_prerequisites(prereq_str):
+    # Returns (True, prerequisites) if prereq_str is empty, a single course code, or course codes joined only by "/" and "or"
+    # or only by "and", otherwise (False, None)
+    prereq_str = prereq_str.strip('. ')
+    if prereq_str == '':
+        return True, None
+    if SIMPLE_OR_LIST.fullmatch(prereq_str):
+        op = 'or'
+    elif SIMPLE_AND_LIST.fullmatch(prereq_str):
+        op = 'and'
+    else:
+        return False, None
+    codes = [code.strip('(). ') for code in SIMPLE_TOKEN.findall(prereq_str)]
+    return True, codes[0] if len(codes) == 1 else {'op': op, 'args': codes}
+
+def parse_prerequisites_grammar(prereq_str):
+    # Parses prereq_str with the grammar, same as parse_prerequisites but without the fast path
     """
     Prerequisite Expression Schemas:
     COURSE CODE,
@@ -25,6 +113,10 @@ def parse_prerequisites(prereq_str):
         ]
     }
     """
+    return parse_expression(preprocess_prerequisites(prereq_str))
+
+def preprocess_prerequisites(prereq_str):
+    # Returns prereq_str with text that the grammar does not handle removed
     ### Preprocessing
     # Replace useless text
     prereq_str = prereq_str.replace("14.0 credits and enrolment in a Computer Science Subject POSt. Restricted to students in the Specialist/Specialist Co-op programs in Computer Science or in the Specialist/Specialist Co-op programs in Management and Information Technology", '')
@@ -43,56 +135,15 @@ def parse_prerequisites(prereq_str):
     # Replace double spaces
     prereq_str = prereq_str.replace('  ', ' ')
     # Strip leading periods
-    prereq_str = prereq_str.strip('. ')
+    return prereq_str.strip('. ')
 
+def parse_expression(prereq_str):
+    # Parses preprocessed prereq_str with the grammar
     # Empty string edgecase
     if prereq_str == '':
         return None
 
-    ### Expression Keywords
-    # Operators
-    AND = pp.Keyword('and')
-    OR = pp.Keyword('or')
-
-    # UTSC Course Code
-    COURSE_CODE = pp.Regex("\\(?[A-Z]{4}[0-9]{2}H3\.?\\)?")
-    # Other campus course codes
-    COURSE_CODE_EXTERN = pp.Regex("\\(?[A-Z]{3}[0-9]{3}(?:(?:H[13]?)|Y)\.?\\)?")
-    # Grade 12 Courses
-    COURSE_GRADE_12 = pp.Literal("Grade 12 Calculus and Vectors") | pp.Literal("one other Grade 12 mathematics course") | pp.Literal("Grade 12 Advanced Functions and Introductory Calculus and Geometry and Discrete Mathematics")
-    # Program requirements
-    OTHER_REQ = pp.Literal("proficiency in C") | pp.Literal("Some experience with programming in an imperative language such as Python, Java or C") | pp.Literal("Three C-level CSC courses") | pp.Literal("at least one other B-level course in Mathematics or Computer Science") | pp.Literal("1.5 credits at the C-level in MAT courses")
-    CREDITS_REQ = pp.Regex("[0-9]+.[0-9]+ [Cc]redits?")
-    CGPA_REQ = pp.Regex("(?:a )?CGPA (?:of (?:at least )?)?[0-9].[0-9],?")
-    SUBJECT_ENROLLMENT_REQ = pp.Regex("enrolment in a (?:(?:CSC)|(?:Computer Science)|(?:Mathematics)) [Ss]ubject POSt,?")
-    NON_SUBJECT_ENROLLMENT_REQ = pp.Regex("enrolment in a non-CSC Subject PO[Ss]t for which this specific course is a program requirement,?")
-    PROGRAM_REQ = OTHER_REQ | CREDITS_REQ | CGPA_REQ | SUBJECT_ENROLLMENT_REQ | NON_SUBJECT_ENROLLMENT_REQ
-    # Everything before a list of prerequisites
-    PREAMBLE = pp.Regex(".*:") | pp.Regex("including,?")
-    # Permission to take course
-    PERMISSION = pp.Literal("Students must obtain consent from the Supervisor of Studies before registering for this course.") | pp.Literal("Permission of the instructor") | pp.Literal("permission of the Supervisor of Studies")
-
-    ### Actions to create prerequisite dictionary and replace unneeded prerequisites with empty strings
-    COURSE_CODE.set_parse_action(lambda m: m[0].strip('(). '))
-    COURSE_CODE_EXTERN.set_parse_action(lambda _: '')
-    COURSE_GRADE_12.set_parse_action(lambda _: '')
-    PROGRAM_REQ.set_parse_action(lambda _: '')
-    PREAMBLE.set_parse_action(lambda _: '')
-    PERMISSION.set_parse_action(lambda _: '')
-
-    operand = COURSE_CODE | COURSE_CODE_EXTERN | COURSE_GRADE_12 | PROGRAM_REQ | PERMISSION
-    #operand.set_parse_action(code).set_name("operand")
-    expression = pp.infix_notation(
-        operand,
-        [
-            (AND, 2, pp.opAssoc.LEFT, lambda m: {'op': 'and', 'args': m[0][0::2]}),
-            (OR, 2, pp.opAssoc.LEFT, lambda m: {'op': 'or', 'args': m[0][0::2]}),
-            (PREAMBLE, 1, pp.opAssoc.RIGHT, lambda m: m[0][1])
-        ],
-        lpar='[',
-        rpar=']'
-    ).set_name("boolean expression")
-    return reduce_prerequisite_dict(expression.parse_string(prereq_str, parse_all=True)[0])
+    return reduce_prerequisite_dict(EXPRESSION.parse_string(prereq_str, parse_all=True)[0])
 
 def reduce_prerequisite_dict(prereqs):
     # Recursively remove empty strings and redundant operators from prerequisite dictionary
@@ -109,41 +160,125 @@ def reduce_prerequisite_dict(prereqs):
         return prereqs['args'][0]
     return prereqs
 
-def parse_prereqs(courses):
-    # Returns dictionary of prerequisites for each course in courses
-    # Schema: { 'code': COURSE CODE, 'prereqs': PREREQUISITE EXPRESSION }
-    prereqs = []
+def parse_expression_result(prereq_str):
+    # Returns [prerequisites, error message] of preprocessed prereq_str, where error message is None if successfully parsed
+    # Unparsed prerequisites are left out instead of stopping the whole run
+    try:
+        return [parse_expression(prereq_str), None]
+    except pp.ParseException as e:
+        return [None, str(e)]
+
+def get_cache_key(prereq_str):
+    # Returns key of preprocessed prereq_str in parse cache
+    return hashlib.sha256(f"{GRAMMAR_VERSION}:{prereq_str}".encode('utf-8')).hexdigest()
+
+def load_cache(cache_filename):
+    # Returns parse cache saved in cache_filename, or empty cache if it does not exist or is from another grammar version
+    # Schema: { CACHE KEY: [PREREQUISITE EXPRESSION, ERROR MESSAGE] }
+    try:
+        with open(cache_filename, 'r') as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        return dict()
+    return cache['results'] if cache.get('version') == GRAMMAR_VERSION else dict()
+
+def save_cache(cache, cache_filename):
+    # Writes parse cache to cache_filename, replacing it atomically so that an interrupted run keeps the previous cache
+    temp_filename = f"{cache_filename}.tmp"
+    with open(temp_filename, 'w') as file:
+        json.dump({'version': GRAMMAR_VERSION, 'results': cache}, file)
+    os.replace(temp_filename, cache_filename)
+
+def parse_prereqs(courses, workers=None, cache=None):
+    # Returns dictionary of prerequisites for each course in courses, along with courses that could not be parsed
+    # and number of prerequisite strings parsed with the grammar
+    # Courses that could not be parsed are left out of prerequisites, since null prerequisites means there are none
+    # Strings found in cache are not parsed again, and newly parsed strings are added to cache
+    # Strings are parsed by a pool of worker processes, one process if workers is 1
+    # Schema: { 'code': COURSE CODE, 'prereqs': PREREQUISITE EXPRESSION }, { COURSE CODE: ERROR MESSAGE }, Number Parsed
+    cache = dict() if cache is None else cache
+    results = dict() # Course code -> [prerequisites, error message]
+    keys = dict() # Course code -> cache key of prerequisites parsed with the grammar
+    pending = dict() # Cache key -> preprocessed prerequisites that are not in cache
     for course in courses:
-        prereq_str = course['fields'].get('Prerequisite', '')
-        prereqs.append({'code': course['code'], 'prereqs': parse_prerequisites(prereq_str)})
-    return prereqs
+        matched, prereqs = parse_simple_prerequisites(course['fields'].get('Prerequisite', ''))
+        if matched:
+            results[course['code']] = [prereqs, None]
+            continue
+        prereq_str = preprocess_prerequisites(course['fields'].get('Prerequisite', ''))
+        keys[course['code']] = key = get_cache_key(prereq_str)
+        if key not in cache:
+            pending[key] = prereq_str
+
+    if workers == 1 or len(pending) <= CHUNK_SIZE:
+        parsed = [parse_expression_result(prereq_str) for prereq_str in pending.values()]
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            parsed = list(executor.map(parse_expression_result, pending.values(), chunksize=CHUNK_SIZE))
+    cache.update(zip(pending.keys(), parsed))
+    results.update({code: cache[key] for code, key in keys.items()})
+
+    prereqs = [{'code': course['code'], 'prereqs': results[course['code']][0]} for course in courses if results[course['code']][1] is None]
+    failures = {course['code']: results[course['code']][1] for course in courses if results[course['code']][1] is not None}
+    return prereqs, failures, len(pending)
 
 def main():
-    # Only parse CMS courses because otherwise this will take one month to finish
-    courses = [course for course in get_courses(INPUT_FILENAME) if course['code'][:3] in ['MAT', 'CSC', 'STA']]
-    prereqs = parse_prereqs(courses)
-    with open(OUTPUT_FILENAME, 'w') as file:
+    parser = argparse.ArgumentParser(description="Parses prerequisites of courses into prerequisite expressions")
+    parser.add_argument('-i', '--input', default=INPUT_FILENAME, help="JSON file containing course information")
+    parser.add_argument('-o', '--output', default=OUTPUT_FILENAME, help="JSON file to write prerequisites to")
+    parser.add_argument('-d', '--departments', nargs='+', help="Only parse courses of departments (e.g. MAT CSC STA), default all")
+    parser.add_argument('-f', '--failures', default=FAILURES_FILENAME, help="JSON file to write prerequisites that could not be parsed to")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument('--cache', default=CACHE_FILENAME, help="JSON file results are cached in between runs")
+    parser.add_argument('--no-cache', action='store_true', help="Parse every prerequisite again, without reading or writing cache")
+    parser.add_argument('--test', action='store_true', help="Check that fast path matches grammar instead of parsing")
+    args = parser.parse_args()
+
+    if args.test:
+        test_fast_path(args.input)
+        return
+
+    courses = get_courses(args.input)
+    if args.departments is not None:
+        courses = [course for course in courses if course['code'][:3] in args.departments]
+    start = time.perf_counter()
+    cache = dict() if args.no_cache else load_cache(args.cache)
+    prereqs, failures, parsed = parse_prereqs(courses, args.workers, cache)
+    if not args.no_cache and parsed > 0:
+        save_cache(cache, args.cache)
+    elapsed = time.perf_counter() - start
+
+    with open(args.output, 'w') as file:
         json.dump(prereqs, file)
+    with open(args.failures, 'w') as file:
+        json.dump([{'code': course['code'], 'prerequisite': course['fields'].get('Prerequisite', ''), 'error': failures[course['code']]}
+                   for course in courses if course['code'] in failures], file, indent=4)
+    print(f"Parsed {len(courses)} courses in {elapsed:.2f}s ({len(courses) / elapsed:.0f} courses/s) with {args.workers} workers")
+    print(f"Prerequisites parsed with grammar: {parsed}, others taken from fast path or cache")
+    print(f"Total unparsed: {len(failures)}/{len(courses)}")
 
-    ### TESTING
-    #print(parse_prerequisites("MATA22H3/MATA31H3"))
-    """
-    courses = [course for course in get_courses(INPUT_FILENAME) if course['code'][:3] in ['MAT', 'CSC', 'STA']]
-    #courses = get_courses(INPUT_FILENAME)
-    count = 0
+def test_fast_path(input_filename=INPUT_FILENAME):
+    # Checks that prerequisites parsed by the fast path are identical to those parsed by the grammar
+    courses = get_courses(input_filename)
+    matched = 0
+    failed = 0
     for course in courses:
+        prereq_str = course['fields'].get('Prerequisite', '')
+        is_simple, prereqs = parse_simple_prerequisites(prereq_str)
+        if not is_simple:
+            continue
+        matched += 1
         try:
-            prereq_str = course['fields'].get('Prerequisite')
-            if prereq_str is not None:
-               prereqs = parse_prerequisites(prereq_str)
-               print(f"{course['code']} - {prereqs}")
+            expected = parse_prerequisites_grammar(prereq_str)
         except pp.ParseException as e:
-            #if ':' in prereq_str:
-            count += 1
-            print(f"Could not parse {course['code']} - Prerequisites: {prereq_str}")
-            print(e)
-    print(f"Total unparsed: {count}/{len(courses)}")
-    """
+            expected = e
+        if prereqs != expected:
+            failed += 1
+            print(f"Fast path differs for {course['code']} - Prerequisites: {prereq_str}")
+            print(f" - Fast path: {prereqs}, grammar: {expected}")
+    print(f"Fast path used for {matched}/{len(courses)} courses")
+    print(f"Total differing: {failed}/{matched}")
+    assert failed == 0, "Fast path does not match grammar"
 
 if __name__ == '__main__':
     main()
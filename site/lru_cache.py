@@ -0,0 +1,78 @@
+"""
+Bounded least-recently-used cache for results derived from course data
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class LruCache:
+    def __init__(self, max_size, ttl=None):
+        self._max_size = max_size # Maximum number of entries kept before least recently used are evicted
+        self._ttl = ttl # Seconds before an entry expires, or None if entries never expire
+        self._entries = OrderedDict() # Key -> (expiry time, value), ordered from least to most recently used
+        self._version = None # Catalog version stamp entries were computed from
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def check_version(self, version):
+        """Clears cache if version differs from version of cached entries"""
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._version = version
+
+    def get(self, key):
+        """Returns value cached for key, or None if key not cached or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+
+    def put(self, key, value):
+        """Caches value for key, evicting least recently used entries if cache is full"""
+        expiry = time.monotonic() + self._ttl if self._ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expiry, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Removes all entries from cache"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Returns cache statistics
+
+        Return Schema:
+        {
+            "size": Number of cached entries,
+            "max_size": Maximum number of cached entries,
+            "hits": Number of lookups that found an entry,
+            "misses": Number of lookups that did not find an entry,
+            "evictions": Number of entries removed to make space,
+            "invalidations": Number of times cache was cleared due to course data changing
+        }
+        """
+        with self._lock:
+            return {"size": len(self._entries),
+                    "max_size": self._max_size,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "invalidations": self.invalidations}
@@ -3,31 +3,65 @@ Flask Website Functions
 """
 
 from datetime import datetime
-from flask import Flask, session, render_template, request, g, redirect, url_for, flash
+from urllib.parse import urlencode
+import os
+from flask import Flask, session, render_template, request, g, redirect, url_for, flash, abort
 from flask_bcrypt import Bcrypt
 import sqlite_db
 import requisite_tree
-
-DB_FILE = 'database.db'
+import requisite_layout
+import lru_cache
+import course_index
+import catalog_snapshot
+
+USER_FILE = sqlite_db.USER_FILE
+CATALOG_FILE = sqlite_db.CATALOG_FILE
+SNAPSHOT_FILE = catalog_snapshot.SNAPSHOT_FILE # Exported with `python3 catalog_snapshot.py`, used if present
+CHART_CACHE_SIZE = 256 # Maximum number of requisite charts kept in memory
+CHART_CACHE_TTL = None # Seconds before cached requisite charts expire, or None to keep them until evicted
+COURSES_PAGE_SIZE = 100 # Default number of courses on each page of course list
+REVIEWS_PAGE_SIZE = 20 # Default number of reviews on each page of review feeds
+MAX_PAGE_SIZE = 500 # Largest number of items a page can be requested to contain
+SUGGEST_RESULTS_SIZE = 20 # Default number of course codes suggested while typing
+TREE_DEPARTMENTS = ['MAT', 'CSC', 'STA'] # Departments whose courses can be selected for requisite trees
 
 # Initialise objects
 app = Flask(__name__)
 app.config['SECRET_KEY'] = b'b949e0ee62dcd1d4aa8f2cf1e8cc9a462ee81fa5a0a0fb9680aef1d2cfc73612'
 bcrypt = Bcrypt(app)
+chart_cache = lru_cache.LruCache(CHART_CACHE_SIZE, CHART_CACHE_TTL)
 
 ### Database Methods
+# Connections are reused across requests instead of being opened for each one
+db_pool = sqlite_db.ConnectionPool(USER_FILE, CATALOG_FILE)
+# Snapshot is mapped before workers are forked, so that they all share the same pages
+catalog = catalog_snapshot.open_snapshot(SNAPSHOT_FILE)
+
 def get_db():
     """Retrieve database object with Singleton pattern"""
     if not hasattr(g, '_db'):
-        g._db = sqlite_db.SqlDb(DB_FILE)
+        g._db = sqlite_db.SqlDb(USER_FILE, db_pool, catalog, CATALOG_FILE)
     return g._db
 
 @app.teardown_appcontext
 def close_connection(exception):
-    """Close database when closing app"""
+    """Return database connection to pool when request ends"""
     if hasattr(g, '_db'):
         g._db.close()
 
+# Move data of database created by an older version of the site into catalog and user databases
+if not os.path.exists(USER_FILE) and os.path.exists(sqlite_db.LEGACY_FILE):
+    sqlite_db.split_database(sqlite_db.LEGACY_FILE, USER_FILE, CATALOG_FILE)
+elif not os.path.exists(CATALOG_FILE):
+    # Empty catalog, filled in with `sqlite_db.reset_courses()`
+    with sqlite_db.update_catalog(USER_FILE, CATALOG_FILE):
+        pass
+# Bring user database up to date with current schema before serving requests, catalog is only changed by maintenance scripts
+with app.app_context():
+    get_db().migrate_user()
+# Connection used for migration must not be inherited by forked workers
+db_pool.close()
+
 
 ### User Functions
 def register_user(username, password):
@@ -51,16 +85,10 @@ def get_username():
     """Returns username of user in current session, or None if user is not logged in"""
     return session.get('user')
 
-def add_review(course_id, rating, content):
-    """Returns True if comment successfully added"""
-    if (username := get_username()):
-        return get_db().add_review(course_id, username, rating, content)
-    return False
-
-def edit_review(course_id, rating, content):
-    """Returns True if comment successfully edited"""
+def submit_review(course_id, rating, content):
+    """Returns True if comment successfully added, or edited if user already reviewed course"""
     if (username := get_username()):
-        return get_db().edit_review(course_id, username, rating, content)
+        return get_db().upsert_review(course_id, username, rating, content) is not None
     return False
 
 def delete_review(course_id):
@@ -84,7 +112,7 @@ def get_user_review(course_id):
     if (username := get_username()):
         return get_db().get_course_review(course_id, username)
 
-def get_user_reviews():
+def get_user_reviews(limit=-1, after=None):
     """Returns list of reviews posted by a user, or None if user is not logged in
     
     Return Schema:
@@ -99,10 +127,54 @@ def get_user_reviews():
     ]
     """
     if (username := get_username()):
-        return get_db().get_user_reviews(username)
-
-def get_requisite_tree_data(type, courses, secondary=None):
-    """Returns data for requisite chart given parameters
+        return get_db().get_user_reviews(username, limit, after)
+
+### Pagination
+def get_page_limit(default):
+    """Returns number of items per page requested with ?limit=, or default if not given"""
+    return max(1, min(request.args.get('limit', default, type=int), MAX_PAGE_SIZE))
+
+def get_review_cursor():
+    """Returns (timestamp, review id) given by ?after= cursor of review feed, or None if on first page"""
+    if (after := request.args.get('after')) is None:
+        return None
+    # Cursor is "<timestamp>:<review id>" of last review on previous page
+    timestamp, _, review_id = after.partition(':')
+    if not (timestamp.isdigit() and review_id.isdigit()):
+        abort(400)
+    return (int(timestamp), int(review_id))
+
+def get_form_count(name, minimum=0):
+    """Returns non-negative integer in form field name, or None if not given. Values that are not integers or are below minimum are rejected"""
+    if (value := request.form.get(name)) is None:
+        return None
+    if not value.isdigit() or int(value) < minimum:
+        abort(400)
+    return int(value)
+
+def get_page(items, limit, get_cursor):
+    """Returns first limit items of items fetched with one extra item, along with cursor of next page
+    or None if this is the last page
+    """
+    if items is None or len(items) <= limit:
+        return items, None
+    return items[:limit], get_cursor(items[limit - 1])
+
+def get_next_page_url(cursor):
+    """Returns url of current page starting after cursor, or None if cursor is None"""
+    if cursor is not None:
+        # Query string is built separately, since its keys could clash with arguments of url_for and view
+        args = request.args.copy()
+        args['after'] = cursor
+        return f"{url_for(request.endpoint, **request.view_args)}?{urlencode(list(args.items(multi=True)))}"
+
+def get_chart_key(type, courses, secondary):
+    """Returns key identifying requisite chart regardless of order of courses"""
+    # Secondary courses only affect complete postrequisite charts
+    return (type, tuple(sorted(set(courses))), tuple(sorted(set(secondary or []))) if type == 'post_complete' else ())
+
+def get_requisite_tree_data(type, courses, secondary=None, layout=False):
+    """Returns data for requisite chart given parameters, along with coordinates of its courses if layout is True
     
     Return Schema:
     {
@@ -110,10 +182,75 @@ def get_requisite_tree_data(type, courses, secondary=None):
         'courses': [list of courses],
         'secondary': [list of courses] // Only if 'post' chosen
     }
+    or, if layout is True:
+    {
+        'tree': Requisite chart,
+        'layout': {
+            course id: [x, y] // Between 0 and 1, from top left corner of chart
+        }
+    }
     """
     db = get_db()
 
-    # Get data for nodes
+    # Reuse chart built for same selection of courses, regardless of the order they were given in
+    chart_cache.check_version(db.get_catalog_version())
+    key = get_chart_key(type, courses, secondary)
+    if (tree := chart_cache.get(key)) is None:
+        tree = create_requisite_tree(db, type, courses, secondary)
+        chart_cache.put(key, tree)
+    if not layout:
+        return tree
+
+    # Layout is cached separately, since it is only needed when chart is drawn
+    if (coordinates := chart_cache.get(key + ('layout',))) is None:
+        coordinates = requisite_layout.create_layout(tree)
+        chart_cache.put(key + ('layout',), coordinates)
+    return {'tree': tree, 'layout': coordinates}
+
+def get_requisite_tree_page(type, courses, secondary=None, max_depth=None, max_nodes=None, cursor=None):
+    """Returns part of requisite chart in breadth first order from courses, so that charts can be fetched layer by layer.
+    Fetching every page by following cursors gives the chart limited to max_depth
+
+    Return Schema:
+    {
+        'tree': {
+            course id: [list of connected courses] // Including courses on later pages
+        },
+        'depths': {
+            course id: Distance from courses
+        },
+        'cursor': Cursor of next page, or None if this is the last page
+    }
+    """
+    # Pages of no courses would never reach the end of the chart
+    if (max_nodes is not None and max_nodes < 1) or (max_depth is not None and max_depth < 0):
+        abort(400)
+    tree = get_requisite_tree_data(type, courses, secondary)
+    version = get_db().get_catalog_version()[1]
+    key = get_chart_key(type, courses, secondary) + ('order',)
+    if (order := chart_cache.get(key)) is None:
+        # Complete postrequisite charts also start from the secondary courses
+        order = requisite_tree.order_tree(tree, courses + (secondary or []) if type == 'post_complete' else courses)
+        chart_cache.put(key, order)
+
+    # Cursor is "<catalog version>:<position>", so that pages from different versions of course data are not mixed
+    start = 0
+    if cursor:
+        cursor_version, _, position = cursor.partition(':')
+        if not (cursor_version.isdigit() and position.isdigit()):
+            abort(400)
+        if int(cursor_version) != version:
+            abort(409)
+        start = int(position)
+
+    page, end = requisite_tree.paginate_tree(tree, order, max_depth, max_nodes, start)
+    depths = dict(order)
+    return {'tree': page,
+            'depths': {course: depths[course] for course in page},
+            'cursor': f"{version}:{end}" if end is not None else None}
+
+def create_requisite_tree(db, type, courses, secondary):
+    """Returns requisite chart of given type with edges to courses outside chart removed"""
     tree = dict()
     if type == 'pre':
         tree = requisite_tree.create_prereq_tree(db, courses)
@@ -131,7 +268,28 @@ def get_requisite_tree_data(type, courses, secondary=None):
 ### API
 @app.post('/api/course_chart')
 def api_course_chart():
-    return get_requisite_tree_data(request.form['type'], request.form.getlist('courses'), request.form.getlist('secondary')), 400
+    # Return chart in pages if any pagination parameters are given
+    if any(parameter in request.form for parameter in ('max_depth', 'max_nodes', 'cursor')):
+        return get_requisite_tree_page(request.form['type'], request.form.getlist('courses'), request.form.getlist('secondary'),
+                                       get_form_count('max_depth'), get_form_count('max_nodes', minimum=1), request.form.get('cursor'))
+    layout = request.form.get('layout') == 'true'
+    return get_requisite_tree_data(request.form['type'], request.form.getlist('courses'), request.form.getlist('secondary'), layout), 400
+
+@app.get('/api/course_chart/cache')
+def api_course_chart_cache():
+    return chart_cache.stats()
+
+@app.get('/api/courses/suggest')
+def api_courses_suggest():
+    limit = get_page_limit(SUGGEST_RESULTS_SIZE)
+    departments = request.args.getlist('department') or None
+    return {'courses': course_index.get_course_index(get_db()).suggest(request.args.get('q', ''), departments, limit)}
+
+@app.get('/api/search')
+def api_search():
+    limit = get_page_limit(sqlite_db.SEARCH_RESULTS_SIZE)
+    results = get_db().search_courses(request.args.get('q', ''), limit)
+    return {'results': [{'course_id': course, 'name': name, 'link': course_page(course)} for course, name in results]}
 
 @app.post('/api/login')
 def api_login():
@@ -160,13 +318,9 @@ def api_logout():
 def api_user_review(course_id):
     if session['user']:
         if request.form['action'] == 'Submit':
-            # Add or edit review depending on if review already posted
-            if get_user_review(course_id):
-                if edit_review(course_id, request.form['rating'], request.form['comment']):
-                    flash("Review successfully edited!", 'success')
-            else:
-                if add_review(course_id, request.form['rating'], request.form['comment']):
-                    flash("Review successfully added!", 'success')
+            # Review is added or edited in one statement, so submitting twice cannot add two reviews
+            if submit_review(course_id, request.form['rating'], request.form['comment']):
+                flash("Review successfully submitted!", 'success')
         elif request.form['action'] == 'Delete':
             if delete_review(course_id):
                 flash("Review successfully deleted!", 'success')
@@ -175,19 +329,21 @@ def api_user_review(course_id):
 ### Pages
 @app.get('/')
 def page_index():
-    return render_template('index.html', reviews=get_user_reviews())
+    limit = get_page_limit(REVIEWS_PAGE_SIZE)
+    reviews, cursor = get_page(get_user_reviews(limit + 1, get_review_cursor()), limit,
+                               lambda review: f"{review['timestamp']}:{review['review_id']}")
+    return render_template('index.html', reviews=reviews, next_page=get_next_page_url(cursor))
 
 @app.get('/courses-tree')
 def page_courses_tree():
-    # Select only MAT, CSC, and STA courses
-    courses = [course for course in get_db().get_courses() if course[:3] in ('MAT', 'CSC', 'STA')]
-    return render_template('courses-tree.html', courses=courses)
+    # Courses are suggested as they are searched for, instead of listing every course
+    return render_template('courses-tree.html', departments=TREE_DEPARTMENTS)
 
 
 @app.get('/courses-tree-visual')
 def page_courses_tree_visual():
-    data = get_requisite_tree_data(request.args['type'], request.args.getlist('courses'), request.args.getlist('secondary'))
-    return render_template('courses-tree-visual.html', data=data)
+    data = get_requisite_tree_data(request.args['type'], request.args.getlist('courses'), request.args.getlist('secondary'), layout=True)
+    return render_template('courses-tree-visual.html', data=data['tree'], layout=data['layout'])
 
 @app.get('/login')
 def page_login():
@@ -197,13 +353,13 @@ def page_login():
 
 @app.get('/course/<course_id>')
 def page_course(course_id):
-    info = get_db().get_course_full_info(course_id)
-    if info is not None:
-        # Get information related to course to pass to template
-        reviews = get_db().get_course_reviews(course_id)
-        rating = get_db().get_course_average_rating(course_id)
-        user_review = get_user_review(course_id)
-        return render_template('course.html', course_id=course_id, info=info, reviews=reviews, rating=rating, user_review=user_review)
+    # Get information related to course to pass to template in one query
+    limit = get_page_limit(REVIEWS_PAGE_SIZE)
+    page = get_db().get_course_page(course_id, get_username(), limit + 1, get_review_cursor())
+    if page is not None:
+        reviews, cursor = get_page(page['reviews'], limit, lambda review: f"{review['timestamp']}:{review['review_id']}")
+        return render_template('course.html', course_id=course_id, info=page['info'], reviews=reviews, rating=page['rating'],
+                               user_review=page['user_review'], next_page=get_next_page_url(cursor))
     return render_template('course-404.html', course=course_id)
 
 @app.get('/courses')
@@ -214,7 +370,9 @@ def page_courses():
         case 'reviews':
             return render_template('courses.html', course_attribute="Reviews", courses=get_db().get_courses_order_by_reviews())
         case _:
-            return render_template('courses.html', courses=get_db().get_courses())
+            limit = get_page_limit(COURSES_PAGE_SIZE)
+            courses, cursor = get_page(get_db().get_courses(limit + 1, request.args.get('after')), limit, lambda course: course)
+            return render_template('courses.html', courses=courses, next_page=get_next_page_url(cursor))
 
 
 @app.template_filter('format_unix')
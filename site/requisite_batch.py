@@ -0,0 +1,148 @@
+"""
+Batch evaluation of eligible courses for many students at once
+"""
+
+import argparse
+import json
+import threading
+import numpy as np
+import requisite_graph
+import sqlite_db
+
+
+class EligibilityEvaluator:
+    def __init__(self, graph):
+        """Compiles prerequisite expressions of requisite graph into levels of vectorised AND/OR reductions,
+        where integer ids of courses in graph are their columns in matrix of taken courses
+        """
+        self.graph = graph # Requisite graph the evaluator was built from
+
+        # Expression nodes, stored in value matrix after columns of courses and constants
+        self._node_op = []
+        self._node_args = []
+        self._node_height = []
+        roots = [(index, self._compile_expression(compiled)) for index, compiled in graph.get_compiled_prereqs()]
+
+        self._false_column = len(graph)
+        self._true_column = len(graph) + 1
+        first_node = len(graph) + 2
+        self._width = first_node + len(self._node_op)
+        def get_column(reference):
+            kind, value = reference
+            if kind == 'course':
+                return value
+            if kind == 'node':
+                return first_node + value
+            return self._true_column if value else self._false_column
+        # Columns of courses with prerequisites data, and columns holding whether their prerequisites are satisfied
+        self._course_columns = np.array([course for course, _ in roots], dtype=np.intp)
+        self._root_columns = np.array([get_column(root) for _, root in roots], dtype=np.intp)
+
+        # Group nodes of each height by operator, padding arguments with the identity of the operator
+        self._levels = []
+        for height in sorted(set(self._node_height)):
+            for op, identity in (('and', self._true_column), ('or', self._false_column)):
+                nodes = [node for node in range(len(self._node_op)) if self._node_height[node] == height and self._node_op[node] == op]
+                if not nodes:
+                    continue
+                width = max(len(self._node_args[node]) for node in nodes)
+                args = np.full((len(nodes), width), identity, dtype=np.intp)
+                for row, node in enumerate(nodes):
+                    args[row, :len(self._node_args[node])] = [get_column(arg) for arg in self._node_args[node]]
+                self._levels.append((op, np.array(nodes, dtype=np.intp) + first_node, args))
+
+    def _compile_expression(self, compiled):
+        """Returns ('node', node) or ('constant', value) representing expression compiled by requisite graph"""
+        if compiled is None:
+            return ('constant', True)
+        op, mask, children = compiled
+        # Courses merged into mask are arguments alongside child expressions
+        args = [('course', index) for index in self.graph.iter_mask(mask)] + [self._compile_expression(child) for child in children]
+        node = len(self._node_op)
+        self._node_op.append(op)
+        self._node_args.append(args)
+        self._node_height.append(1 + max([self._node_height[value] for kind, value in args if kind == 'node'], default=0))
+        return ('node', node)
+
+    def get_taken_matrix(self, students):
+        """Returns boolean matrix of students x courses, where courses no prerequisite expression uses are ignored"""
+        taken = np.zeros((len(students), len(self.graph)), dtype=bool)
+        for row, courses in enumerate(students):
+            taken[row, [index for course in courses if (index := self.graph.get_index(course)) is not None]] = True
+        return taken
+
+    def evaluate(self, taken):
+        """Returns boolean matrix of students x courses with prerequisites data, marking which prerequisites are satisfied"""
+        values = np.zeros((taken.shape[0], self._width), dtype=bool)
+        values[:, :taken.shape[1]] = taken
+        values[:, self._true_column] = True
+        # Lower levels only depend on courses, so each level is evaluated in one vectorised reduction
+        for op, nodes, args in self._levels:
+            if op == 'and':
+                values[:, nodes] = values[:, args].all(axis=2)
+            else:
+                values[:, nodes] = values[:, args].any(axis=2)
+        return values[:, self._root_columns]
+
+    def get_eligible_courses(self, students):
+        """Returns list of courses each student has not taken yet and whose prerequisites are satisfied
+
+        Return Schema:
+        [
+            [list of courses] // One list for each list of taken courses in students
+        ]
+        """
+        taken = self.get_taken_matrix(students)
+        eligible = self.evaluate(taken) & ~taken[:, self._course_columns]
+        courses = np.array(self.graph.courses, dtype=object)[self._course_columns]
+        return [courses[row].tolist() for row in eligible]
+
+
+# Evaluator of most recently used requisite graph, shared by all batches of the process
+_evaluator = None
+_evaluator_lock = threading.Lock()
+
+def get_evaluator(db):
+    """Returns eligibility evaluator of requisite graph of database, recompiling it whenever graph is reloaded"""
+    global _evaluator
+    graph = requisite_graph.get_graph(db)
+    with _evaluator_lock:
+        if _evaluator is None or _evaluator.graph is not graph:
+            _evaluator = EligibilityEvaluator(graph)
+        return _evaluator
+
+def get_eligible_courses(db, students):
+    """Returns courses each student can take next given the courses they completed
+
+    Return Schema:
+    {
+        student: [list of courses]
+    }
+    """
+    names = list(students.keys())
+    eligible = get_evaluator(db).get_eligible_courses([students[name] for name in names])
+    return dict(zip(names, eligible))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lists courses each student can take next")
+    parser.add_argument('students', help="JSON file mapping each student to list of completed courses")
+    parser.add_argument('-o', '--output', help="JSON file to write eligible courses to (default: print)")
+    parser.add_argument('--db', default=sqlite_db.CATALOG_FILE, help="Catalog database file containing course data")
+    args = parser.parse_args()
+
+    with open(args.students, 'r') as f:
+        students = json.load(f)
+    db = sqlite_db.SqlDb(args.db)
+    eligible = get_eligible_courses(db, students)
+    db.close()
+
+    if args.output is None:
+        for student, courses in eligible.items():
+            print(f"{student}: {', '.join(courses)}")
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(eligible, f)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Process-wide in-memory index of the prerequisite/postrequisite graph
+"""
+
+from array import array
+import threading
+
+
+class RequisiteGraph:
+    def __init__(self, version, edges, closure, prereqs):
+        """Compiles list of (postreq id, prereq id) edges, (ancestor id, descendant id) closure pairs and
+        (course id, prerequisite expression) pairs into compact arrays
+        """
+        self.version = version # Catalog version stamp the graph was built from
+        self.courses = [] # Course ids, indexed by their interned integer id
+        self._index = dict() # Course id -> interned integer id
+
+        # Prerequisite expressions as network of AND/OR nodes, where node is satisfied once need[node] children are satisfied
+        self._node_need = array('i')
+        self._node_parent = array('i') # Parent node, or -1 for root node of expression
+        self._root_course = dict() # Root node -> integer id of course it unlocks
+        self._course_root = dict() # Integer id of course -> root node of its expression, or None if no prerequisites
+        self._leaf_nodes = dict() # Integer id of course -> nodes satisfied by taking course
+        # Prerequisite expressions as (op, mask, children) bitmask tests, or None if no prerequisites
+        self._compiled = dict() # Integer id of course -> compiled expression
+        for course, expression in prereqs:
+            index = self._intern(course)
+            if expression is None:
+                self._course_root[index] = None
+                self._compiled[index] = None
+            else:
+                root = self._course_root[index] = self._compile_expression(expression, -1)
+                self._root_course[root] = index
+                self._compiled[index] = self._compile_mask(expression)
+
+        edges = [(self._intern(postreq), self._intern(prereq)) for postreq, prereq in edges]
+        # Forward edges point from a course to its prerequisites, reverse edges to its postrequisites
+        self._prereq_offsets, self._prereq_targets = RequisiteGraph._compress(len(self.courses), edges)
+        self._postreq_offsets, self._postreq_targets = RequisiteGraph._compress(len(self.courses), [(prereq, postreq) for postreq, prereq in edges])
+
+        # Transitive closure as bitsets, where bit j of ancestors[i] is set if j is directly or indirectly required by i
+        self._ancestors = [0] * len(self.courses)
+        self._descendants = [0] * len(self.courses)
+        for ancestor, descendant in closure:
+            # Closure only contains courses which appear in edges
+            ancestor, descendant = self._index[ancestor], self._index[descendant]
+            self._ancestors[descendant] |= 1 << ancestor
+            self._descendants[ancestor] |= 1 << descendant
+
+    def _compile_expression(self, expression, parent):
+        """Adds nodes of prerequisite expression to network, returning its root node"""
+        node = len(self._node_need)
+        self._node_parent.append(parent)
+        if type(expression) == str:
+            # Leaf is satisfied by taking the course itself
+            self._node_need.append(1)
+            self._leaf_nodes.setdefault(self._intern(expression), []).append(node)
+            return node
+        if expression['op'] == 'and':
+            self._node_need.append(len(expression['args']))
+        elif expression['op'] == 'or':
+            self._node_need.append(1)
+        else:
+            # Unknown operators can never be satisfied
+            self._node_need.append(len(expression['args']) + 1)
+        for arg in expression['args']:
+            self._compile_expression(arg, node)
+        return node
+
+    def _compile_mask(self, expression):
+        """Returns prerequisite expression as (op, mask, children), where course arguments are merged into mask"""
+        if type(expression) == str:
+            return ('or', 1 << self._intern(expression), ())
+        if expression['op'] not in ('and', 'or'):
+            # Unknown operators can never be satisfied
+            return ('or', 0, ())
+        mask = 0
+        children = []
+        for arg in expression['args']:
+            if type(arg) == str:
+                mask |= 1 << self._intern(arg)
+            else:
+                children.append(self._compile_mask(arg))
+        return (expression['op'], mask, tuple(children))
+
+    def _check_mask(compiled, taken):
+        """Returns whether compiled expression is satisfied by bitset of taken courses"""
+        op, mask, children = compiled
+        if op == 'and':
+            return taken & mask == mask and all(RequisiteGraph._check_mask(child, taken) for child in children)
+        return taken & mask != 0 or any(RequisiteGraph._check_mask(child, taken) for child in children)
+
+    def __len__(self):
+        return len(self.courses)
+
+    def _intern(self, course):
+        """Returns integer id of course, assigning a new one if course not seen before"""
+        if (index := self._index.get(course)) is None:
+            index = self._index[course] = len(self.courses)
+            self.courses.append(course)
+        return index
+
+    def _compress(size, edges):
+        """Returns (offsets, targets) arrays in CSR format, where targets[offsets[i]:offsets[i + 1]] are the neighbours of i"""
+        offsets = array('i', [0] * (size + 1))
+        for source, _ in edges:
+            offsets[source + 1] += 1
+        for i in range(size):
+            offsets[i + 1] += offsets[i]
+        targets = array('i', [0] * len(edges))
+        position = offsets[:-1]
+        for source, target in edges:
+            targets[position[source]] = target
+            position[source] += 1
+        return offsets, targets
+
+    def get_index(self, course):
+        """Returns interned integer id of course, or None if course has no requisite relations"""
+        return self._index.get(course)
+
+    def prereq_indices(self, index):
+        """Returns integer ids of prerequisite courses of course with integer id index"""
+        return self._prereq_targets[self._prereq_offsets[index]:self._prereq_offsets[index + 1]]
+
+    def postreq_indices(self, index):
+        """Returns integer ids of postrequisite courses of course with integer id index"""
+        return self._postreq_targets[self._postreq_offsets[index]:self._postreq_offsets[index + 1]]
+
+    def ancestors_mask(self, index):
+        """Returns bitset of integer ids of all direct and indirect prerequisites of course with integer id index"""
+        return self._ancestors[index]
+
+    def descendants_mask(self, index):
+        """Returns bitset of integer ids of all courses that directly or indirectly require course with integer id index"""
+        return self._descendants[index]
+
+    def iter_mask(self, mask):
+        """Generator object for integer ids of courses in bitset"""
+        while mask:
+            lowest = mask & -mask
+            yield lowest.bit_length() - 1
+            mask ^= lowest
+
+    def get_ancestors(self, course):
+        """Returns list of all direct and indirect prerequisite courses of course"""
+        if (index := self.get_index(course)) is None:
+            return []
+        return [self.courses[i] for i in self.iter_mask(self._ancestors[index])]
+
+    def get_descendants(self, course):
+        """Returns list of all courses that directly or indirectly require course"""
+        if (index := self.get_index(course)) is None:
+            return []
+        return [self.courses[i] for i in self.iter_mask(self._descendants[index])]
+
+    def get_mask(self, courses):
+        """Returns bitset of integer ids of courses, ignoring courses that no prerequisite expression uses"""
+        mask = 0
+        for course in courses:
+            if (index := self.get_index(course)) is not None:
+                mask |= 1 << index
+        return mask
+
+    def check_prereqs_satisfied(self, course, taken):
+        """Returns whether prerequisites of course are satisfied by bitset of taken courses"""
+        compiled = self._compiled.get(self.get_index(course))
+        return compiled is None or RequisiteGraph._check_mask(compiled, taken)
+
+    def get_satisfied_courses(self, courses):
+        """Returns list of every course with prerequisites data whose prerequisites are satisfied by courses"""
+        taken = self.get_mask(courses)
+        return [self.courses[index] for index, compiled in self._compiled.items()
+                if compiled is None or RequisiteGraph._check_mask(compiled, taken)]
+
+    def get_unlocked_courses(self, taken, candidates):
+        """Returns list of candidate courses whose prerequisites become satisfied by taken courses,
+        where each unlocked candidate also counts as taken
+        """
+        need = self._node_need[:]
+        candidates = {index for course in candidates if (index := self.get_index(course)) is not None}
+        unlocked = []
+
+        # Courses with no prerequisite expression are unlocked immediately
+        worklist = [index for course in taken if (index := self.get_index(course)) is not None]
+        done = set(worklist)
+        for index in candidates:
+            if index not in done and self._course_root.get(index) is None:
+                done.add(index)
+                unlocked.append(index)
+                worklist.append(index)
+
+        # Propagate satisfaction from leaves of each newly taken course up to roots of the expressions that use it
+        while worklist:
+            for node in self._leaf_nodes.get(worklist.pop(), ()):
+                need[node] -= 1
+                # Satisfied nodes notify their parents only the first time they become satisfied
+                while need[node] == 0 and (parent := self._node_parent[node]) != -1:
+                    node = parent
+                    need[node] -= 1
+                if need[node] == 0 and self._node_parent[node] == -1:
+                    index = self._root_course[node]
+                    if index in candidates and index not in done:
+                        done.add(index)
+                        unlocked.append(index)
+                        worklist.append(index)
+        return [self.courses[index] for index in unlocked]
+
+    def get_compiled_prereqs(self):
+        """Returns list of (integer id, compiled expression) of every course with prerequisites data,
+        where compiled expression is (op, mask, children) or None if no prerequisites
+        """
+        return list(self._compiled.items())
+
+    def get_prereq_courses(self, course):
+        """Returns list of prerequisite courses of course"""
+        if (index := self.get_index(course)) is None:
+            return []
+        return [self.courses[i] for i in self.prereq_indices(index)]
+
+    def get_postreq_courses(self, course):
+        """Returns list of postrequisite courses of course"""
+        if (index := self.get_index(course)) is None:
+            return []
+        return [self.courses[i] for i in self.postreq_indices(index)]
+
+
+# Graph of most recently used catalog, shared by all requests of the process
+_graph = None
+_graph_lock = threading.Lock()
+
+def get_graph(db):
+    """Returns requisite graph of database, reloading it if course data has changed since it was built"""
+    global _graph
+    version = db.get_catalog_version()
+    with _graph_lock:
+        if _graph is None or _graph.version != version:
+            _graph = RequisiteGraph(version, db.get_requisite_edges(), db.get_course_closure(), db.get_all_course_prereqs())
+        return _graph
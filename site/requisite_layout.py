@@ -0,0 +1,140 @@
+"""
+Layered (Sugiyama-style) layout of requisite trees, so that clients only have to draw them
+"""
+
+# Number of alternating down and up sweeps used to reduce edge crossings
+CROSSING_REDUCTION_SWEEPS = 8
+
+
+def create_layout(tree):
+    """Returns coordinates of courses in tree, with edges pointing downwards between layers
+
+    Return Schema:
+    {
+        course id: [x, y] // Between 0 and 1, from top left corner of drawing
+    }
+    """
+    nodes = list(tree.keys())
+    if not nodes:
+        return dict()
+    edges = [(course, to_course) for course, course_list in tree.items() for to_course in course_list if to_course in tree]
+    edges = _remove_cycles(nodes, edges)
+    layers = _assign_layers(nodes, edges)
+    order = _insert_dummy_nodes(layers, edges)
+    order = _reduce_crossings(order)
+
+    # Spread nodes of each layer evenly across the width of the drawing
+    coordinates = dict()
+    for depth, layer in enumerate(order):
+        for position, node in enumerate(layer):
+            if not _is_dummy(node):
+                coordinates[node] = [round((position + 1) / (len(layer) + 1), 4), round((depth + 0.5) / len(order), 4)]
+    return coordinates
+
+def _remove_cycles(nodes, edges):
+    """Returns edges with edges closing a cycle reversed, found by depth first search"""
+    adjacent = {node: [] for node in nodes}
+    for from_node, to_node in edges:
+        adjacent[from_node].append(to_node)
+
+    # 0 = unvisited, 1 = on current search path, 2 = finished
+    state = {node: 0 for node in nodes}
+    back_edges = set()
+    for start in nodes:
+        if state[start]:
+            continue
+        state[start] = 1
+        stack = [(start, iter(adjacent[start]))]
+        while stack:
+            node, neighbours = stack[-1]
+            for neighbour in neighbours:
+                if state[neighbour] == 1:
+                    back_edges.add((node, neighbour))
+                elif state[neighbour] == 0:
+                    state[neighbour] = 1
+                    stack.append((neighbour, iter(adjacent[neighbour])))
+                    break
+            else:
+                state[node] = 2
+                stack.pop()
+    return [(to_node, from_node) if (from_node, to_node) in back_edges else (from_node, to_node)
+            for from_node, to_node in edges if from_node != to_node]
+
+def _assign_layers(nodes, edges):
+    """Returns layer of each node, placing each node one layer below its lowest parent (longest path layering)"""
+    parents = {node: 0 for node in nodes}
+    children = {node: [] for node in nodes}
+    for from_node, to_node in edges:
+        parents[to_node] += 1
+        children[from_node].append(to_node)
+
+    layers = {node: 0 for node in nodes}
+    queue = [node for node in nodes if parents[node] == 0]
+    while queue:
+        node = queue.pop()
+        for child in children[node]:
+            layers[child] = max(layers[child], layers[node] + 1)
+            parents[child] -= 1
+            if parents[child] == 0:
+                queue.append(child)
+    return layers
+
+def _is_dummy(node):
+    return type(node) == tuple
+
+def _insert_dummy_nodes(layers, edges):
+    """Returns list of layers, each being list of nodes with edges to the layer below,
+    where edges spanning several layers are split with dummy nodes
+    """
+    order = [[] for _ in range(max(layers.values()) + 1)]
+    for node, depth in layers.items():
+        order[depth].append({'id': node, 'up': [], 'down': []})
+    nodes = {layer_node['id']: layer_node for layer in order for layer_node in layer}
+
+    for from_node, to_node in edges:
+        previous = nodes[from_node]
+        for depth in range(layers[from_node] + 1, layers[to_node]):
+            dummy = {'id': (from_node, to_node, depth), 'up': [], 'down': []}
+            order[depth].append(dummy)
+            previous['down'].append(dummy)
+            dummy['up'].append(previous)
+            previous = dummy
+        previous['down'].append(nodes[to_node])
+        nodes[to_node]['up'].append(previous)
+    return order
+
+def _count_crossings(upper, lower):
+    """Returns number of crossings between edges from layer upper to layer lower"""
+    positions = {id(node): position for position, node in enumerate(lower)}
+    edges = sorted((position, positions[id(child)]) for position, node in enumerate(upper) for child in node['down'])
+    return sum(1 for i in range(len(edges)) for j in range(i + 1, len(edges))
+               if edges[i][0] < edges[j][0] and edges[i][1] > edges[j][1])
+
+def _reduce_crossings(order):
+    """Returns list of layers of node ids, reordered with the barycenter heuristic to reduce edge crossings"""
+    def crossings():
+        return sum(_count_crossings(order[depth], order[depth + 1]) for depth in range(len(order) - 1))
+
+    def sort_by_barycenter(layer, fixed, neighbours):
+        positions = {id(node): position for position, node in enumerate(fixed)}
+        def barycenter(item):
+            position, node = item
+            adjacent = [positions[id(other)] for other in node[neighbours]]
+            # Nodes without neighbours keep their current position
+            return sum(adjacent) / len(adjacent) if adjacent else position
+        return [node for _, node in sorted(enumerate(layer), key=barycenter)]
+
+    best = [layer[:] for layer in order]
+    best_crossings = crossings()
+    for sweep in range(CROSSING_REDUCTION_SWEEPS):
+        if best_crossings == 0:
+            break
+        if sweep % 2 == 0:
+            for depth in range(1, len(order)):
+                order[depth] = sort_by_barycenter(order[depth], order[depth - 1], 'up')
+        else:
+            for depth in range(len(order) - 2, -1, -1):
+                order[depth] = sort_by_barycenter(order[depth], order[depth + 1], 'down')
+        if (current := crossings()) < best_crossings:
+            best, best_crossings = [layer[:] for layer in order], current
+    return [[node['id'] for node in layer] for layer in best]
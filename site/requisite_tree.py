@@ -2,9 +2,11 @@
 Functions for creating pre/postrequisite tree objects
 """
 
-### Prerequisite Tree
-def create_course_prereq_tree(db, course):
-    """Returns adjacency tree containing partial prerequisites originating from course
+import requisite_graph
+import sqlite_db
+
+def _create_tree(graph, courses, postreqs=False):
+    """Returns adjacency tree of all courses reachable from courses in requisite graph
 
     Return Schema:
     [
@@ -13,16 +15,35 @@ def create_course_prereq_tree(db, course):
         }
     ]
     """
+    get_neighbours = graph.postreq_indices if postreqs else graph.prereq_indices
+    get_reachable = graph.descendants_mask if postreqs else graph.ancestors_mask
     tree = dict()
 
-    # Traverse tree with queue and storing visited courses in tree
-    queue = {course}
-    while queue:
-        curr = queue.pop()
-        tree[curr] = db.get_prereq_courses(curr)
-        queue.update([prereq for prereq in tree[curr] if prereq not in tree.keys()])
+    # Reachable courses are looked up in transitive closure instead of traversing the graph
+    reachable = 0
+    for course in courses:
+        if (index := graph.get_index(course)) is None:
+            # Course has no requisite relations
+            tree[course] = []
+        else:
+            reachable |= (1 << index) | get_reachable(index)
+    for index in graph.iter_mask(reachable):
+        tree[graph.courses[index]] = [graph.courses[i] for i in get_neighbours(index)]
     return tree
 
+### Prerequisite Tree
+def create_course_prereq_tree(db, course):
+    """Returns adjacency tree containing partial prerequisites originating from course
+
+    Return Schema:
+    [
+        {
+            course id: [list of connected courses]
+        }
+    ]
+    """
+    return _create_tree(requisite_graph.get_graph(db), [course])
+
 def create_prereq_tree(db, courses):
     """Returns adjacency tree containing partial prerequisites originating from courses
 
@@ -33,14 +54,8 @@ def create_prereq_tree(db, courses):
         }
     ]
     """
-    tree = dict()
-
-    # Take union of prerequisite trees of courses
-    for course in courses:
-        # If course is already added, then its prerequisite tree is also already in the tree
-        if course not in tree.keys():
-            tree.update(create_course_prereq_tree(db, course))
-    return tree
+    # Union of prerequisite trees of courses is the tree reachable from all of them
+    return _create_tree(requisite_graph.get_graph(db), courses)
 
 ### Postrequisite Tree
 def create_course_postreq_tree(db, course):
@@ -53,15 +68,7 @@ def create_course_postreq_tree(db, course):
         }
     ]
     """
-    tree = dict()
-
-    # Traverse tree with queue and storing visited courses in tree
-    queue = {course}
-    while queue:
-        curr = queue.pop()
-        tree[curr] = db.get_postreq_courses(curr)
-        queue.update([postreq for postreq in tree[curr] if postreq not in tree.keys()])
-    return tree
+    return _create_tree(requisite_graph.get_graph(db), [course], postreqs=True)
 
 def create_partial_postreq_tree(db, courses):
     """Returns adjacency tree containing partial postrequisites originating from courses
@@ -73,14 +80,8 @@ def create_partial_postreq_tree(db, courses):
         }
     ]
     """
-    tree = dict()
-
-    # Take union of postrequisite trees of courses
-    for course in courses:
-        # If course is already added, then its postrequisite tree is also already in the tree
-        if course not in tree.keys():
-            tree.update(create_course_postreq_tree(db, course))
-    return tree
+    # Union of postrequisite trees of courses is the tree reachable from all of them
+    return _create_tree(requisite_graph.get_graph(db), courses, postreqs=True)
 
 def check_prereqs_satisfied(course_list, prereqs):
     """Returns whether prerequisites are satisfied given list of courses"""
@@ -94,6 +95,10 @@ def check_prereqs_satisfied(course_list, prereqs):
     elif prereqs['op'] == 'and':
         return all(check_prereqs_satisfied(course_list, prereq) for prereq in prereqs['args'])
 
+def get_satisfied_courses(db, courses):
+    """Returns list of all courses whose prerequisites are satisfied given list of courses"""
+    return requisite_graph.get_graph(db).get_satisfied_courses(courses)
+
 def create_complete_postreq_tree(db, primary, secondary):
     """Returns adjacency tree containing complete postrequisites of primary courses satisfied from secondary courses
 
@@ -104,21 +109,92 @@ def create_complete_postreq_tree(db, primary, secondary):
         }
     ]
     """
+    graph = requisite_graph.get_graph(db)
     # Get all possible courses that could appear in complete prerequisite tree
-    course_pool = create_partial_postreq_tree(db, primary)
+    course_pool = _create_tree(graph, primary, postreqs=True)
     # Begin tree with parameter courses already added
     tree = {course: course_pool[course] for course in primary}
-    tree.update({course: db.get_postreq_courses(course) for course in secondary})
-
-    # Repeatedly iterate over course_list until tree doesn't change for entire loop
-    changed = True
-    while changed:
-        changed = False
-        for course, prereq_courses in course_pool.items():
-            if course not in tree.keys():
-                # Check if prerequisites of course satisfied with courses in tree
-                prereqs = db.get_course_prereqs(course)
-                if check_prereqs_satisfied(tree.keys(), prereqs):
+    tree.update({course: graph.get_postreq_courses(course) for course in secondary})
+
+    # Courses are unlocked by propagating each taken course only to the prerequisite expressions that use it
+    for course in graph.get_unlocked_courses(tree.keys(), course_pool.keys()):
+        tree[course] = course_pool[course]
+    return tree
+
+### Pagination
+def order_tree(tree, courses):
+    """Returns courses of tree in breadth first order from courses, along with their distance from courses.
+    Courses and their neighbours are visited in sorted order, so that order does not depend on the order courses were given in
+
+    Return Schema:
+    [
+        (course id, depth)
+    ]
+    """
+    order = [(course, 0) for course in sorted(set(courses)) if course in tree]
+    visited = {course for course, _ in order}
+    i = 0
+    while i < len(order):
+        curr, depth = order[i]
+        for course in sorted(tree[curr]):
+            if course not in visited:
+                visited.add(course)
+                order.append((course, depth + 1))
+        i += 1
+    # Every course should be reachable from courses, but keep remaining courses so that pages cover entire tree
+    last_depth = order[-1][1] + 1 if order else 0
+    order.extend((course, last_depth) for course in sorted(tree) if course not in visited)
+    return order
+
+def paginate_tree(tree, order, max_depth=None, max_nodes=None, start=0):
+    """Returns page of tree containing up to max_nodes courses at most max_depth away from start courses,
+    starting from position start in order, along with position of next page or None if this is the last page
+
+    Return Schema:
+    (
+        {
+            course id: [list of connected courses within max_depth]
+        },
+        Position of next page
+    )
+    """
+    if max_depth is not None:
+        order = [(course, depth) for course, depth in order if depth <= max_depth]
+    end = len(order) if max_nodes is None else min(len(order), start + max_nodes)
+    included = {course for course, _ in order}
+    page = {course: [to_course for to_course in tree[course] if to_course in included] for course, _ in order[start:end]}
+    return page, end if end < len(order) else None
+
+def test_complete_postreq_tree():
+    """Checks that complete postrequisite trees match repeatedly checking every course until nothing changes"""
+    db = sqlite_db.get_db()
+    courses = [course for course in db.get_courses() if course[:3] in ('MAT', 'CSC', 'STA')]
+
+    def create_complete_postreq_tree_by_fixpoint(primary, secondary):
+        course_pool = create_partial_postreq_tree(db, primary)
+        tree = {course: course_pool[course] for course in primary}
+        tree.update({course: db.get_postreq_courses(course) for course in secondary})
+        changed = True
+        while changed:
+            changed = False
+            for course, prereq_courses in course_pool.items():
+                if course not in tree.keys() and check_prereqs_satisfied(tree.keys(), db.get_course_prereqs(course)):
                     tree[course] = prereq_courses
                     changed = True
-    return tree
+        return tree
+
+    # Each course on its own, with its prerequisites already taken, and all courses at once
+    cases = [([course], []) for course in courses]
+    cases += [([course], db.get_course_ancestors(course)) for course in courses]
+    cases.append((courses, []))
+    failed = 0
+    for primary, secondary in cases:
+        if create_complete_postreq_tree(db, primary, secondary) != create_complete_postreq_tree_by_fixpoint(primary, secondary):
+            failed += 1
+            print(f"Trees differ for primary {primary} and secondary {secondary}")
+    print(f"Total differing: {failed}/{len(cases)}")
+    assert failed == 0, "Complete postrequisite trees do not match fixpoint"
+
+
+if __name__ == "__main__":
+    test_complete_postreq_tree()
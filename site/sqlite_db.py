@@ -4,12 +4,39 @@ Direct handling of sqlite3 database (manages tables, executes queries)
 
 import sqlite3
 import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from urllib.parse import quote
 
 # Files containing data
 COURSES_FILE = 'data/courses.json'
 PREREQUISITES_FILE = 'data/prerequisites.json'
 
+# Course data is kept apart from user data, so that catalog reads never wait for review writes
+CATALOG_FILE = 'catalog.db' # Course tables, replaced as a whole when course data changes and otherwise immutable
+USER_FILE = 'users.db' # User, review and review statistics tables
+LEGACY_FILE = 'database.db' # Database holding both, created by older versions of the site
+CATALOG_SCHEMA = 'catalog' # Name catalog database is attached as
+
+BULK_BATCH_SIZE = 1000 # Number of rows inserted by each executemany call of bulk import
+SEARCH_RESULTS_SIZE = 20 # Default number of courses returned by search
+# Relative weight of matches in code, name, description and fields columns when ranking search results
+SEARCH_WEIGHTS = (10.0, 5.0, 1.0, 1.0)
+
+### Connection Pool Settings
+POOL_SIZE = 8 # Maximum number of idle connections kept open
+CACHE_SIZE = -16000 # Page cache of each connection, in pages if positive or in KiB if negative
+MMAP_SIZE = 64 * 1024 * 1024 # Bytes of database file read through memory mapping
+JOURNAL_MODE = 'WAL' # Lets readers continue while a write is in progress
+SYNCHRONOUS = 'NORMAL' # WAL mode stays consistent without syncing on every commit
+BUSY_TIMEOUT = 5000 # Milliseconds to wait for a lock held by another connection
+
 ### Database Schema
 USER_SCHEMA = """
     User (username      TEXT PRIMARY KEY NOT NULL,
@@ -41,31 +68,160 @@ COURSE_PRE_POST_REQ_SCHEMA = """
                       FOREIGN KEY(postreq_id) REFERENCES Course(id),
                       FOREIGN KEY(prereq_id) REFERENCES Course(id))
 """
+# Table containing transitive closure of CoursePrePostReq, i.e. every course that is directly or indirectly required by another
+COURSE_CLOSURE_SCHEMA = """
+    CourseClosure (ancestor_id   CHAR(8) NOT NULL,
+                   descendant_id CHAR(8) NOT NULL,
+                   PRIMARY KEY (descendant_id, ancestor_id)) WITHOUT ROWID
+"""
+COURSE_CLOSURE_ANCESTOR_INDEX = """
+    CourseClosureAncestor ON CourseClosure (ancestor_id, descendant_id)
+"""
+# Lets postrequisites be looked up by prereq_id, the second column of the primary key
+COURSE_PRE_POST_REQ_PREREQ_INDEX = """
+    CoursePrePostReqPrereq ON CoursePrePostReq (prereq_id, postreq_id)
+"""
+# Full-text index of course text, where fields holds values of all CourseFields of course.
+# Rows share rowid with their Course row, so that the row of a course is found without scanning the unindexed course_id
+COURSE_SEARCH_SCHEMA = """
+    CourseSearch USING fts5(course_id UNINDEXED, code, name, description, fields)
+"""
+# Secondary indexes on course tables, which bulk import builds after inserting data
+COURSE_INDEXES = [COURSE_CLOSURE_ANCESTOR_INDEX, COURSE_PRE_POST_REQ_PREREQ_INDEX]
 REVIEW_SCHEMA = """
     Review (id                   INTEGER PRIMARY KEY AUTOINCREMENT,
             timestamp            DATETIME NOT NULL,
-            course_id            CHAR(8) NOT NULL,
+            course_id            CHAR(8) NOT NULL, -- Course is in catalog database, so add_review checks that it exists
             username             TEXT NOT NULL,
             rating               INT NOT NULL CHECK(0 <= rating AND rating <= 10),
             content              TEXT,
             UNIQUE (course_id, username),
-            FOREIGN KEY(course_id) REFERENCES Course(id),
             FOREIGN KEY(username) REFERENCES User(username))
 """
+# Review statistics of every course, kept up to date by triggers on Review
+COURSE_STATS_SCHEMA = """
+    CourseStats (course_id      CHAR(8) PRIMARY KEY NOT NULL,
+                 review_count   INT NOT NULL DEFAULT 0,
+                 rating_sum     INT NOT NULL DEFAULT 0,
+                 average_rating REAL)
+"""
+COURSE_RATING_COUNTS_SCHEMA = """
+    CourseRatingCounts (course_id CHAR(8) NOT NULL,
+                        rating    INT NOT NULL,
+                        count     INT NOT NULL,
+                        PRIMARY KEY (course_id, rating)) WITHOUT ROWID
+"""
+# Covering indexes, so that courses are listed in order without sorting or reading the table
+COURSE_STATS_REVIEW_COUNT_INDEX = """
+    CourseStatsReviewCount ON CourseStats (review_count DESC, course_id)
+"""
+COURSE_STATS_AVERAGE_RATING_INDEX = """
+    CourseStatsAverageRating ON CourseStats (average_rating DESC, course_id)
+"""
+# Reviews of a user or of a course are read newest first, so timestamp follows the filtered column
+REVIEW_USERNAME_INDEX = """
+    ReviewUsernameTimestamp ON Review (username, timestamp)
+"""
+REVIEW_COURSE_INDEX = """
+    ReviewCourseTimestamp ON Review (course_id, timestamp)
+"""
+# Secondary indexes on user tables
+USER_INDEXES = [REVIEW_USERNAME_INDEX, REVIEW_COURSE_INDEX, COURSE_STATS_REVIEW_COUNT_INDEX, COURSE_STATS_AVERAGE_RATING_INDEX]
+REVIEW_INSERT_STATS_TRIGGER = """
+    ReviewInsertStats AFTER INSERT ON Review BEGIN
+        INSERT INTO CourseStats (course_id, review_count, rating_sum, average_rating) VALUES (NEW.course_id, 1, NEW.rating, NEW.rating)
+        ON CONFLICT(course_id) DO UPDATE SET review_count=review_count + 1,
+                                             rating_sum=rating_sum + NEW.rating,
+                                             average_rating=CAST(rating_sum + NEW.rating AS REAL) / (review_count + 1);
+        INSERT INTO CourseRatingCounts VALUES (NEW.course_id, NEW.rating, 1)
+        ON CONFLICT(course_id, rating) DO UPDATE SET count=count + 1;
+    END
+"""
+REVIEW_DELETE_STATS_TRIGGER = """
+    ReviewDeleteStats AFTER DELETE ON Review BEGIN
+        UPDATE CourseStats SET review_count=review_count - 1,
+                               rating_sum=rating_sum - OLD.rating,
+                               average_rating=CAST(rating_sum - OLD.rating AS REAL) / NULLIF(review_count - 1, 0)
+        WHERE course_id=OLD.course_id;
+        UPDATE CourseRatingCounts SET count=count - 1 WHERE course_id=OLD.course_id AND rating=OLD.rating;
+        DELETE FROM CourseRatingCounts WHERE course_id=OLD.course_id AND rating=OLD.rating AND count=0;
+    END
+"""
+REVIEW_UPDATE_STATS_TRIGGER = """
+    ReviewUpdateStats AFTER UPDATE OF course_id, rating ON Review BEGIN
+        UPDATE CourseStats SET review_count=review_count - 1,
+                               rating_sum=rating_sum - OLD.rating,
+                               average_rating=CAST(rating_sum - OLD.rating AS REAL) / NULLIF(review_count - 1, 0)
+        WHERE course_id=OLD.course_id;
+        UPDATE CourseRatingCounts SET count=count - 1 WHERE course_id=OLD.course_id AND rating=OLD.rating;
+        DELETE FROM CourseRatingCounts WHERE course_id=OLD.course_id AND rating=OLD.rating AND count=0;
+        INSERT INTO CourseStats (course_id, review_count, rating_sum, average_rating) VALUES (NEW.course_id, 1, NEW.rating, NEW.rating)
+        ON CONFLICT(course_id) DO UPDATE SET review_count=review_count + 1,
+                                             rating_sum=rating_sum + NEW.rating,
+                                             average_rating=CAST(rating_sum + NEW.rating AS REAL) / (review_count + 1);
+        INSERT INTO CourseRatingCounts VALUES (NEW.course_id, NEW.rating, 1)
+        ON CONFLICT(course_id, rating) DO UPDATE SET count=count + 1;
+    END
+"""
 
 ### Complex SQL Queries
 GET_COURSE_ORDER_BY_REVIEWS = """
-    SELECT Course.id, COUNT(Review.id) FROM Course LEFT JOIN Review ON Course.id=Review.course_id
-    GROUP BY Course.id ORDER BY COUNT(Review.id)
-    DESC LIMIT ?
+    SELECT course_id, review_count FROM CourseStats
+    ORDER BY review_count DESC, course_id LIMIT ?
 """
 GET_COURSE_AVERAGE_RATING = """
-    SELECT CAST(SUM(rating) AS REAL) / COUNT(id) FROM Review WHERE course_id=?
+    SELECT average_rating FROM CourseStats WHERE course_id=?
 """
 GET_COURSE_ORDER_BY_AVERAGE_RATING = """
-    SELECT Course.id, CAST(SUM(Review.rating) AS REAL) / COUNT(Review.id) FROM Course LEFT JOIN Review ON Course.id=Review.course_id
-    GROUP BY Course.id ORDER BY CAST(SUM(Review.rating) AS REAL) / COUNT(Review.id)
-    DESC LIMIT ?
+    SELECT course_id, average_rating FROM CourseStats
+    ORDER BY average_rating DESC, course_id LIMIT ?
+"""
+INSERT_COURSE_STATS_QUERY = """
+    INSERT INTO CourseStats (course_id, review_count, rating_sum, average_rating)
+    SELECT Course.id, COUNT(Review.id), TOTAL(Review.rating), CAST(SUM(Review.rating) AS REAL) / COUNT(Review.id)
+    FROM Course LEFT JOIN Review ON Course.id=Review.course_id GROUP BY Course.id
+"""
+INSERT_COURSE_RATING_COUNTS_QUERY = """
+    INSERT INTO CourseRatingCounts SELECT course_id, rating, COUNT(*) FROM Review GROUP BY course_id, rating
+"""
+# Adds every pair created by new edge (postreq, prereq): prereq and its ancestors become ancestors of postreq and its descendants
+INSERT_COURSE_CLOSURE_EDGE_QUERY = """
+    INSERT OR IGNORE INTO CourseClosure (ancestor_id, descendant_id)
+    SELECT Ancestor.id, Descendant.id FROM
+        (SELECT ? AS id UNION SELECT ancestor_id FROM CourseClosure WHERE descendant_id=?) AS Ancestor,
+        (SELECT ? AS id UNION SELECT descendant_id FROM CourseClosure WHERE ancestor_id=?) AS Descendant
+"""
+INSERT_COURSE_SEARCH_QUERY = """
+    INSERT INTO CourseSearch (rowid, course_id, code, name, description, fields)
+    SELECT rowid, id, id, name, description, (SELECT group_concat(field_value, ' ') FROM CourseFields WHERE course_id=Course.id)
+    FROM Course
+"""
+INSERT_COURSE_SEARCH_BY_ID = INSERT_COURSE_SEARCH_QUERY + " WHERE id=?"
+DELETE_COURSE_SEARCH_BY_ID = "DELETE FROM CourseSearch WHERE rowid=(SELECT rowid FROM Course WHERE id=?)"
+SEARCH_COURSES_QUERY = f"""
+    SELECT CourseSearch.course_id, CourseSearch.name FROM CourseSearch WHERE CourseSearch MATCH ?
+    ORDER BY bm25(CourseSearch, 0.0, {', '.join(map(str, SEARCH_WEIGHTS))}) LIMIT ?
+"""
+# Everything shown on a course page, with fields and reviews as JSON arrays so that one row holds all of it
+GET_COURSE_PAGE_QUERY = """
+    SELECT Course.name, Course.description, Course.link,
+           (SELECT json_group_array(json_array(field_name, field_value)) FROM CourseFields WHERE course_id=Course.id),
+           (SELECT json_group_array(json_array(id, timestamp, username, rating, content)) FROM
+               (SELECT * FROM Review WHERE course_id=Course.id {after} ORDER BY timestamp DESC, id DESC LIMIT :limit)),
+           CourseStats.review_count, CourseStats.average_rating,
+           (SELECT json_array(id, timestamp, username, rating, content) FROM Review WHERE course_id=Course.id AND username=:username)
+    FROM Course LEFT JOIN CourseStats ON Course.id=CourseStats.course_id WHERE Course.id=:course
+"""
+GET_COURSE_PAGE = GET_COURSE_PAGE_QUERY.format(after="")
+GET_COURSE_PAGE_AFTER = GET_COURSE_PAGE_QUERY.format(after="AND (timestamp, id) < (:timestamp, :review_id)")
+INSERT_COURSE_CLOSURE_QUERY = """
+    WITH RECURSIVE Reachable(ancestor_id, descendant_id) AS (
+        SELECT prereq_id, postreq_id FROM CoursePrePostReq
+        UNION
+        SELECT CoursePrePostReq.prereq_id, Reachable.descendant_id FROM CoursePrePostReq
+        JOIN Reachable ON CoursePrePostReq.postreq_id=Reachable.ancestor_id
+    )
+    INSERT INTO CourseClosure (ancestor_id, descendant_id) SELECT ancestor_id, descendant_id FROM Reachable
 """
 
 ### SQL Queries
@@ -74,43 +230,240 @@ INSERT_COURSE_QUERY =                     "INSERT INTO Course VALUES (?, ?, ?, ?
 INSERT_COURSE_FIELDS_QUERY =              "INSERT INTO CourseFields VALUES(?, ?, ?)"
 INSERT_COURSE_PREREQS_QUERY =             "INSERT INTO CoursePrereqs VALUES (?, ?)"
 INSERT_COURSE_PRE_POST_REQ_SCHEMA_QUERY = "INSERT INTO CoursePrePostReq VALUES (?, ?)"
+INSERT_OR_IGNORE_COURSE_PRE_POST_REQ =    "INSERT OR IGNORE INTO CoursePrePostReq VALUES (?, ?)"
 INSERT_REVIEW_QUERY =                     "INSERT INTO Review(timestamp, course_id, username, rating, content) VALUES (strftime('%s'), ?, ?, ?, ?)"
 INSERT_REVIEW_CUSTOM_DATE =               "INSERT INTO Review(timestamp, course_id, username, rating, content) VALUES (?, ?, ?, ?, ?)"
+# Adds review, or edits it if user already reviewed course, only if course exists. WHERE keeps ON CONFLICT from being parsed as a join
+UPSERT_REVIEW_QUERY = """
+    INSERT INTO Review(timestamp, course_id, username, rating, content)
+    SELECT strftime('%s'), :course_id, :username, :rating, :content WHERE EXISTS (SELECT 1 FROM Course WHERE id=:course_id)
+    ON CONFLICT(course_id, username) DO UPDATE SET rating=excluded.rating, content=excluded.content, timestamp=excluded.timestamp
+    RETURNING id, timestamp, course_id, username, rating, content
+"""
+UPDATE_COURSE_QUERY =                     "UPDATE Course SET name=?, description=?, link=? WHERE id=?"
+UPDATE_COURSE_FIELDS_QUERY =              "UPDATE CourseFields SET field_value=? WHERE course_id=? AND field_name=?"
+UPDATE_COURSE_PREREQS_QUERY =             "UPDATE CoursePrereqs SET prereqs_json=? WHERE course_id=?"
 UPDATE_REVIEW_QUERY =                     "UPDATE Review SET rating=?, content=?, timestamp=strftime('%s') WHERE course_id=? AND username=?"
 DELETE_REVIEW_QUERY =                     "DELETE FROM Review WHERE course_id=? AND username=?"
+DELETE_COURSE_QUERY =                     "DELETE FROM Course WHERE id=?"
+DELETE_COURSE_FIELDS_QUERY =              "DELETE FROM CourseFields WHERE course_id=? AND field_name=?"
+DELETE_COURSE_PREREQS_QUERY =             "DELETE FROM CoursePrereqs WHERE course_id=?"
+DELETE_COURSE_PRE_POST_REQ_QUERY =        "DELETE FROM CoursePrePostReq WHERE postreq_id=? AND prereq_id=?"
 
 GET_USER_BY_USERNAME =                    "SELECT username, password FROM User WHERE username=?"
-GET_COURSE_IDS =                          "SELECT id FROM Course LIMIT ?"
+GET_COURSE_IDS =                          "SELECT id FROM Course ORDER BY id LIMIT ?"
+GET_COURSE_IDS_AFTER =                    "SELECT id FROM Course WHERE id>? ORDER BY id LIMIT ?"
 GET_COURSE_BY_ID =                        "SELECT * FROM Course WHERE id=?"
+GET_COURSE_EXISTS =                       "SELECT 1 FROM Course WHERE id=?"
 GET_COURSE_FIELDS_BY_ID =                 "SELECT field_name, field_value FROM CourseFields WHERE course_id=?"
-GET_REVIEW_BY_COURSE_ID =                 "SELECT * FROM Review WHERE course_id=? ORDER BY timestamp DESC LIMIT ?"
-GET_REVIEW_BY_USERNAME =                  "SELECT * FROM Review WHERE username=? ORDER BY timestamp DESC LIMIT ?"
+GET_REVIEW_BY_COURSE_ID =                 "SELECT * FROM Review WHERE course_id=? ORDER BY timestamp DESC, id DESC LIMIT ?"
+GET_REVIEW_BY_USERNAME =                  "SELECT * FROM Review WHERE username=? ORDER BY timestamp DESC, id DESC LIMIT ?"
+# Reviews are paged by (timestamp, id) of the last review of the previous page, which stays valid while reviews are added
+GET_REVIEW_BY_COURSE_ID_AFTER =           "SELECT * FROM Review WHERE course_id=? AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT ?"
+GET_REVIEW_BY_USERNAME_AFTER =            "SELECT * FROM Review WHERE username=? AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT ?"
 GET_REVIEW_BY_COURSE_ID_AND_USERNAME =    "SELECT * FROM Review WHERE course_id=? AND username=?"
 GET_COURSE_PREREQS_BY_ID =                "SELECT prereqs_json FROM CoursePrereqs WHERE course_id=?"
 GET_PREREQ_COURSES_BY_COURSE_ID =         "SELECT * FROM CoursePrePostReq WHERE postreq_id=?"
 GET_POSTREQ_COURSES_BY_COURSE_ID =        "SELECT * FROM CoursePrePostReq WHERE prereq_id=?"
+GET_ALL_COURSES =                         "SELECT id, name, description, link FROM Course"
+GET_ALL_COURSE_FIELDS =                   "SELECT course_id, field_name, field_value FROM CourseFields"
+GET_REVIEWED_COURSE_IDS =                 "SELECT DISTINCT course_id FROM Review"
+GET_ALL_COURSE_PREREQS =                  "SELECT course_id, prereqs_json FROM CoursePrereqs"
+GET_REQUISITE_EDGES =                     "SELECT postreq_id, prereq_id FROM CoursePrePostReq"
+GET_COURSE_ANCESTORS_BY_COURSE_ID =       "SELECT ancestor_id FROM CourseClosure WHERE descendant_id=?"
+GET_COURSE_DESCENDANTS_BY_COURSE_ID =     "SELECT descendant_id FROM CourseClosure WHERE ancestor_id=?"
+GET_COURSE_CLOSURE =                      "SELECT ancestor_id, descendant_id FROM CourseClosure"
+COUNT_COURSE_CLOSURE =                    "SELECT COUNT(*) FROM CourseClosure"
+COUNT_REQUISITE_EDGES =                   "SELECT COUNT(*) FROM CoursePrePostReq"
+DELETE_COURSE_CLOSURE_QUERY =             "DELETE FROM CourseClosure"
+DELETE_COURSE_STATS_QUERY =               "DELETE FROM CourseStats"
+DELETE_COURSE_RATING_COUNTS_QUERY =       "DELETE FROM CourseRatingCounts"
+GET_COURSE_RATING_COUNTS_BY_ID =          "SELECT rating, count FROM CourseRatingCounts WHERE course_id=?"
+COUNT_COURSES =                           "SELECT COUNT(*) FROM Course"
+# Whether review statistics are missing for a course in catalog or kept for a course no longer in catalog
+GET_COURSE_STATS_OUTDATED = """
+    SELECT EXISTS (SELECT id FROM Course EXCEPT SELECT course_id FROM CourseStats)
+        OR EXISTS (SELECT course_id FROM CourseStats EXCEPT SELECT id FROM Course)
+"""
+# Whether search index is missing a course, or has a row that does not share rowid with its course
+GET_COURSE_SEARCH_OUTDATED = """
+    SELECT EXISTS (SELECT rowid, id FROM Course EXCEPT SELECT rowid, course_id FROM CourseSearch)
+        OR EXISTS (SELECT rowid, course_id FROM CourseSearch EXCEPT SELECT rowid, id FROM Course)
+"""
+DELETE_COURSE_SEARCH_QUERY =              "DELETE FROM CourseSearch"
+
+# Queries that are meant to read or write entire tables, which test_query_plans allows to scan them
+FULL_SCAN_QUERIES = {'GET_COURSE_IDS', 'GET_ALL_COURSES', 'GET_ALL_COURSE_FIELDS', 'GET_REVIEWED_COURSE_IDS', 'GET_ALL_COURSE_PREREQS',
+                     'GET_REQUISITE_EDGES', 'GET_COURSE_CLOSURE', 'COUNT_COURSE_CLOSURE', 'COUNT_REQUISITE_EDGES', 'COUNT_COURSES',
+                     'GET_COURSE_STATS_OUTDATED', 'DELETE_COURSE_CLOSURE_QUERY', 'DELETE_COURSE_STATS_QUERY', 'DELETE_COURSE_RATING_COUNTS_QUERY',
+                     'INSERT_COURSE_CLOSURE_QUERY', 'INSERT_COURSE_STATS_QUERY',
+                     'INSERT_COURSE_RATING_COUNTS_QUERY', 'GET_COURSE_ORDER_BY_REVIEWS', 'GET_COURSE_ORDER_BY_AVERAGE_RATING',
+                     'INSERT_COURSE_SEARCH_QUERY', 'GET_COURSE_SEARCH_OUTDATED', 'DELETE_COURSE_SEARCH_QUERY'}
+
+# Version stamp of course data, stored in the header of the database holding course data and incremented whenever it changes
+GET_CATALOG_VERSION =                     "PRAGMA {schema}.user_version"
+SET_CATALOG_VERSION =                     "PRAGMA {schema}.user_version = {version}"
+# Tables copied out of legacy databases by split_database
+LEGACY_COURSE_TABLES = ['Course', 'CourseFields', 'CoursePrereqs', 'CoursePrePostReq']
+LEGACY_USER_TABLES = ['User', 'Review']
+
+
+def connect(db_file, catalog_file=None, catalog_writable=False, pragmas=[], check_same_thread=True):
+    """Returns connection to database, with catalog database attached if given so that course tables resolve to it"""
+    con = sqlite3.connect(db_file, uri=True, check_same_thread=check_same_thread)
+    # Pragmas without a schema apply to every attached database, so they are run before attaching catalog
+    for pragma in pragmas:
+        con.execute(pragma)
+    if catalog_file is not None:
+        # Immutable catalog is read without locking or checking for changes, which is why it is only ever replaced as a whole
+        mode = "mode=rwc" if catalog_writable else "mode=ro&immutable=1"
+        con.execute(f"ATTACH DATABASE ? AS {CATALOG_SCHEMA}", (f"file:{quote(os.path.abspath(catalog_file))}?{mode}",))
+    return con
+
+
+class ConnectionPool:
+    def __init__(self, db_file, catalog_file=None, max_size=POOL_SIZE, cache_size=CACHE_SIZE, mmap_size=MMAP_SIZE,
+                 journal_mode=JOURNAL_MODE, synchronous=SYNCHRONOUS, busy_timeout=BUSY_TIMEOUT):
+        self._db_file = db_file # File that contains database
+        self._catalog_file = catalog_file # File that contains course data, or None if course data is in db_file
+        self._max_size = max_size # Maximum number of idle connections kept open
+        self._pragmas = [f"PRAGMA cache_size = {int(cache_size)}",
+                         f"PRAGMA mmap_size = {int(mmap_size)}",
+                         f"PRAGMA journal_mode = {journal_mode}",
+                         f"PRAGMA synchronous = {synchronous}",
+                         f"PRAGMA busy_timeout = {int(busy_timeout)}",
+                         "PRAGMA foreign_keys = 1"]
+        self._idle = [] # Connections that are open and not in use
+        self._catalog_signatures = dict() # Connection -> signature of catalog file it attached
+        self._pids = dict() # Connection -> id of process that opened it
+        self._inherited = [] # Connections opened by parent process before fork, kept so they are never closed in child
+        self._lock = threading.Lock()
+
+    def _get_catalog_signature(self):
+        """Returns signature that changes when catalog file is replaced"""
+        if self._catalog_file is not None:
+            try:
+                stat = os.stat(self._catalog_file)
+                return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                return None
+
+    def _connect(self):
+        """Returns new connection to database with pool settings applied"""
+        signature = self._get_catalog_signature()
+        # Connections are handed between threads, but only used by one thread at a time
+        con = connect(self._db_file, self._catalog_file, pragmas=self._pragmas, check_same_thread=False)
+        with self._lock:
+            self._catalog_signatures[con] = signature
+            self._pids[con] = os.getpid()
+        return con
+
+    def _discard(self, con):
+        """Closes connection, unless it was opened by another process which still owns the underlying file handles"""
+        with self._lock:
+            self._catalog_signatures.pop(con, None)
+            if self._pids.pop(con, None) != os.getpid():
+                self._inherited.append(con)
+                return
+        con.close()
+
+    def _is_healthy(self, con):
+        """Returns whether connection can still execute queries"""
+        try:
+            con.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        """Returns warm idle connection if a healthy one is available, otherwise opens a new connection.
+        Connections which attached a catalog file that has since been replaced are closed instead of reused,
+        and connections inherited from a parent process through fork are never handed out
+        """
+        signature = self._get_catalog_signature()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                con = self._idle.pop()
+                current = self._catalog_signatures.get(con) == signature and self._pids.get(con) == os.getpid()
+            if current and self._is_healthy(con):
+                return con
+            self._discard(con)
+        return self._connect()
+
+    def release(self, con):
+        """Returns connection to pool, closing it if pool is already full"""
+        if con.in_transaction:
+            con.rollback()
+        with self._lock:
+            if len(self._idle) < self._max_size:
+                self._idle.append(con)
+                return
+        self._discard(con)
+
+    def close(self):
+        """Closes all idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for con in idle:
+            self._discard(con)
 
 
 class SqlDb:
-    def __init__(self, db_file):
+    def __init__(self, db_file, pool=None, snapshot=None, catalog_file=None, catalog_writable=False):
+        """Opens database in db_file, where course tables are read from catalog_file if given.
+        Catalog is opened read-only unless catalog_writable, which should only be used on a copy of a catalog in use
+        """
         self._db_file = db_file # File that contains database
-        self._con = sqlite3.connect(db_file) # Connection object to database
-
-        self._con.execute("PRAGMA foreign_keys = 1") # Turn on foreign keys
+        self._catalog_file = catalog_file or db_file # File that contains course data
+        self._catalog = CATALOG_SCHEMA if catalog_file else 'main' # Schema of course tables
+        self._pool = pool # Pool connection is borrowed from, or None if connection is owned by this object
+        self._snapshot = snapshot # Memory-mapped snapshot course data is read from while it is up to date, or None
+        self._snapshot_current = None # Whether snapshot matches course data, or None if not checked yet
+        if pool is None:
+            self._con = connect(db_file, catalog_file, catalog_writable) # Connection object to database
+            self._con.execute("PRAGMA foreign_keys = 1") # Turn on foreign keys
+        else:
+            self._con = pool.acquire()
+        self._transaction_depth = 0 # Number of transaction scopes currently open
 
 
     ### Database Management
     def _commit(self):
-        """Saves all changes to database"""
-        self._con.commit()
+        """Saves all changes to database, unless they are part of an open transaction scope"""
+        if self._transaction_depth == 0:
+            self._con.commit()
 
     def _rollback(self):
         """Rolls back changes made to database"""
         self._con.rollback()
 
+    @contextmanager
+    def transaction(self):
+        """Context manager grouping writes so that they are committed once when the outermost scope exits,
+        or all rolled back if an exception is raised
+        """
+        if self._transaction_depth == 0 and not self._con.in_transaction:
+            # Begin explicitly, since sqlite3 only begins transactions implicitly before data modifying statements
+            self._con.execute("BEGIN")
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self._rollback()
+            raise
+        self._transaction_depth -= 1
+        self._commit()
+
     def close(self):
-        """Close database connection"""
-        self._con.close()
+        """Close database connection, or return it to its pool"""
+        if self._pool is None:
+            self._con.close()
+        else:
+            self._pool.release(self._con)
 
     def print_user_db(self):
         """Prints all user-related tables in database"""
@@ -129,14 +482,55 @@ class SqlDb:
         if (input(f"You are about to reset all user data in {self._db_file}. Confirm? (y/n) ").lower() == "y"):
             self._drop_user_tables()
             self._create_user_tables()
-            self._commit()
+            self.rebuild_course_stats()
 
     def reset_course_db(self):
         """Deletes all course-related data in database and reinitialises it"""
-        if (input(f"You are about to reset all course data in {self._db_file}. Confirm? (y/n) ").lower() == "y"):
+        if (input(f"You are about to reset all course data in {self._catalog_file}. Confirm? (y/n) ").lower() == "y"):
             self._drop_course_tables()
             self._create_course_tables()
-            self._commit()
+            self._bump_catalog_version()
+
+    def migrate(self):
+        """Brings database created by an older version of the site up to the current schema"""
+        self.migrate_catalog()
+        self.migrate_user()
+
+    def migrate_catalog(self):
+        """Brings course tables up to the current schema, which requires catalog to be writable"""
+        with self.transaction():
+            self._create_course_tables()
+            # Closure is built from existing prerequisite relations if it did not exist before
+            if self._con.execute(COUNT_COURSE_CLOSURE).fetchone()[0] == 0 and self._con.execute(COUNT_REQUISITE_EDGES).fetchone()[0] > 0:
+                self.rebuild_course_closure()
+            # Search index is built from existing courses if it did not exist before or was keyed by an older version
+            if self._con.execute(GET_COURSE_SEARCH_OUTDATED).fetchone()[0]:
+                self.rebuild_course_search()
+
+    def migrate_user(self):
+        """Brings user tables up to the current schema, and matches review statistics with courses in catalog"""
+        with self.transaction():
+            self._create_user_tables()
+            # Statistics are rebuilt from reviews if they did not exist before or courses were added or removed since
+            if self._con.execute(GET_COURSE_STATS_OUTDATED).fetchone()[0]:
+                self.rebuild_course_stats()
+
+    def rebuild_course_search(self):
+        """Recomputes CourseSearch full-text index from all courses"""
+        self._execute_queries([(DELETE_COURSE_SEARCH_QUERY, ()),
+                               (INSERT_COURSE_SEARCH_QUERY, ())])
+
+    def rebuild_course_stats(self):
+        """Recomputes CourseStats and CourseRatingCounts tables from all reviews"""
+        self._execute_queries([(DELETE_COURSE_STATS_QUERY, ()),
+                               (DELETE_COURSE_RATING_COUNTS_QUERY, ()),
+                               (INSERT_COURSE_STATS_QUERY, ()),
+                               (INSERT_COURSE_RATING_COUNTS_QUERY, ())])
+
+    def rebuild_course_closure(self):
+        """Recomputes CourseClosure table from all prerequisite relations"""
+        if self._execute_queries([(DELETE_COURSE_CLOSURE_QUERY, ()), (INSERT_COURSE_CLOSURE_QUERY, ())]) is not None:
+            self._bump_catalog_version()
 
     def add_test_user_data(self):
         """Note: Reset database before creating test data"""
@@ -165,12 +559,186 @@ class SqlDb:
                 if data['prereqs'] is not None:
                     self.add_prerequisites(data['code'], data['prereqs'])
 
+    def bulk_insert_course_data(self, courses_file, prerequisites_file, batch_size=BULK_BATCH_SIZE):
+        """Insert all course and prerequisite data into database in a single transaction, returning number of rows inserted.
+        Faster than insert_course_data, but expects course tables to be empty
+        """
+        start = time.perf_counter()
+        rows = 0
+        with self.transaction():
+            # Indexes are built once after loading instead of being updated for every row
+            for index in COURSE_INDEXES:
+                self._con.execute(f"DROP INDEX IF EXISTS {self._catalog}.{index.split()[0]}")
+
+            # Add data to Course and CourseFields tables
+            course_ids = set()
+            def generate_course_rows():
+                with open(courses_file, 'r', encoding='utf-8') as f:
+                    for data in SqlDb.generate_json_array(f):
+                        course_ids.add(data['code'])
+                        yield ((data['code'], data['name'], data['description'], data['link']),
+                               [(data['code'], field, value) for field, value in data['fields'].items()])
+            for batch in SqlDb.generate_batches(generate_course_rows(), batch_size):
+                self._con.executemany(INSERT_COURSE_QUERY, [course for course, _ in batch])
+                self._con.executemany(INSERT_COURSE_FIELDS_QUERY, [field for _, fields in batch for field in fields])
+                rows += len(batch) + sum(len(fields) for _, fields in batch)
+
+            # Add data to CoursePrereqs and CoursePrePostReq tables, skipping courses that do not exist anymore
+            def generate_prereq_rows():
+                with open(prerequisites_file, 'r') as f:
+                    for data in SqlDb.generate_json_array(f):
+                        if data['prereqs'] is not None and data['code'] in course_ids:
+                            yield ((data['code'], json.dumps(data['prereqs'])),
+                                   [(data['code'], prereq_id) for prereq_id in SqlDb.generate_prereq_courses(data['prereqs']) if prereq_id in course_ids])
+            for batch in SqlDb.generate_batches(generate_prereq_rows(), batch_size):
+                self._con.executemany(INSERT_COURSE_PREREQS_QUERY, [prereqs for prereqs, _ in batch])
+                self._con.executemany(INSERT_OR_IGNORE_COURSE_PRE_POST_REQ, [edge for _, edges in batch for edge in edges])
+                rows += len(batch) + sum(len(edges) for _, edges in batch)
+
+            # Closure is built from all relations at once instead of one relation at a time
+            self.rebuild_course_closure()
+            self.rebuild_course_search()
+            for index in COURSE_INDEXES:
+                self._con.execute(f"CREATE INDEX IF NOT EXISTS {self._catalog}.{index.strip()}")
+        elapsed = time.perf_counter() - start
+        print(f"Inserted {rows} rows in {elapsed:.2f}s ({rows / elapsed:.0f} rows/s)")
+        return rows
+
+    def sync_course_data(self, courses_file, prerequisites_file):
+        """Updates course and prerequisite data to match data files in a single transaction, only writing rows that changed.
+        Courses which have reviews are kept even if they no longer appear in data files, so that reviews stay intact
+
+        Return Schema:
+        {
+            table name: (Rows Inserted, Rows Updated, Rows Deleted)
+        }
+        """
+        # Read data files into same shape as rows in database
+        courses, fields, prereqs = dict(), dict(), dict()
+        with open(courses_file, 'r', encoding='utf-8') as f:
+            for data in SqlDb.generate_json_array(f):
+                courses[data['code']] = (data['name'], data['description'], data['link'])
+                fields.update({(data['code'], field): value for field, value in data['fields'].items()})
+        with open(prerequisites_file, 'r') as f:
+            for data in SqlDb.generate_json_array(f):
+                if data['prereqs'] is not None:
+                    prereqs[data['code']] = data['prereqs']
+
+        with self.transaction():
+            # Courses with reviews and their data are kept as they are in database
+            retained = {row[0] for row in self._execute_read(GET_REVIEWED_COURSE_IDS)} - courses.keys()
+            current_courses = {row[0]: (row[1], row[2], row[3]) for row in self._execute_read(GET_ALL_COURSES) if row[0] not in retained}
+            current_fields = {(row[0], row[1]): row[2] for row in self._execute_read(GET_ALL_COURSE_FIELDS) if row[0] not in retained}
+            current_prereqs = {course: expression for course, expression in self.get_all_course_prereqs() if course not in retained}
+            # Relations of kept courses are kept too, except ones to deleted courses, which would fail their foreign key
+            course_ids = courses.keys() | retained
+            current_edges = {edge for edge in self.get_requisite_edges() if edge[0] not in retained or edge[1] not in course_ids}
+
+            # Prerequisites only refer to courses that exist, like when inserting them one by one
+            prereqs = {course: expression for course, expression in prereqs.items() if course in courses}
+            edges = {(course, prereq_id) for course, expression in prereqs.items()
+                     for prereq_id in SqlDb.generate_prereq_courses(expression) if prereq_id in course_ids}
+
+            def diff(new, current):
+                """Returns (inserted, updated, deleted) keys between dictionaries"""
+                return ([key for key in new.keys() - current.keys()],
+                        [key for key in new.keys() & current.keys() if new[key] != current[key]],
+                        [key for key in current.keys() - new.keys()])
+            course_changes = diff(courses, current_courses)
+            field_changes = diff(fields, current_fields)
+            prereq_changes = diff(prereqs, current_prereqs)
+            edge_changes = (list(edges - current_edges), [], list(current_edges - edges))
+
+            # Search index is only updated for courses whose name, description or fields changed,
+            # and their rows are looked up by rowid of course, so they are removed before courses are deleted
+            search_changes = sorted({course for keys in course_changes for course in keys} | {course for keys in field_changes for course, _ in keys})
+            self._con.executemany(DELETE_COURSE_SEARCH_BY_ID, [(course,) for course in search_changes])
+
+            # Remove rows referring to deleted courses before deleting courses
+            self._con.executemany(DELETE_COURSE_PRE_POST_REQ_QUERY, edge_changes[2])
+            self._con.executemany(DELETE_COURSE_PREREQS_QUERY, [(course,) for course in prereq_changes[2]])
+            self._con.executemany(DELETE_COURSE_FIELDS_QUERY, field_changes[2])
+            self._con.executemany(DELETE_COURSE_QUERY, [(course,) for course in course_changes[2]])
+
+            self._con.executemany(INSERT_COURSE_QUERY, [(course,) + courses[course] for course in course_changes[0]])
+            self._con.executemany(UPDATE_COURSE_QUERY, [courses[course] + (course,) for course in course_changes[1]])
+            self._con.executemany(INSERT_COURSE_FIELDS_QUERY, [key + (fields[key],) for key in field_changes[0]])
+            self._con.executemany(UPDATE_COURSE_FIELDS_QUERY, [(fields[key],) + key for key in field_changes[1]])
+            self._con.executemany(INSERT_COURSE_PREREQS_QUERY, [(course, json.dumps(prereqs[course])) for course in prereq_changes[0]])
+            self._con.executemany(UPDATE_COURSE_PREREQS_QUERY, [(json.dumps(prereqs[course]), course) for course in prereq_changes[1]])
+            self._con.executemany(INSERT_COURSE_PRE_POST_REQ_SCHEMA_QUERY, edge_changes[0])
+
+            # Removed relations can remove indirect ones too, so closure is only updated incrementally for added relations
+            if edge_changes[2]:
+                self.rebuild_course_closure()
+            else:
+                for postreq_id, prereq_id in edge_changes[0]:
+                    self._con.execute(INSERT_COURSE_CLOSURE_EDGE_QUERY, (prereq_id, prereq_id, postreq_id, postreq_id))
+            self._con.executemany(INSERT_COURSE_SEARCH_BY_ID, [(course,) for course in search_changes])
+
+            changes = {"Course": course_changes,
+                       "CourseFields": field_changes,
+                       "CoursePrereqs": prereq_changes,
+                       "CoursePrePostReq": edge_changes}
+            changes = {table: tuple(len(keys) for keys in table_changes) for table, table_changes in changes.items()}
+            if any(any(counts) for counts in changes.values()):
+                self._bump_catalog_version()
+        return changes
+
+    def generate_json_array(file, chunk_size=65536):
+        """Generator object for incrementally decoding elements of JSON array in file without loading entire file"""
+        decoder = json.JSONDecoder()
+        buffer = file.read(chunk_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{file.name} does not contain a JSON array")
+        position = 1
+        while True:
+            # Skip whitespace and separators between elements
+            while True:
+                while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                    position += 1
+                if position < len(buffer) or not (chunk := file.read(chunk_size)):
+                    break
+                buffer, position = chunk, 0
+            if position == len(buffer) or buffer[position] == ']':
+                return
+
+            # Read more of file until next element is complete
+            while True:
+                try:
+                    element, end = decoder.raw_decode(buffer, position)
+                    if end < len(buffer):
+                        break
+                except json.JSONDecodeError:
+                    pass
+                if not (chunk := file.read(chunk_size)):
+                    element, end = decoder.raw_decode(buffer, position)
+                    break
+                buffer, position = buffer[position:] + chunk, 0
+            yield element
+            position = end
+
+    def generate_batches(rows, batch_size):
+        """Generator object for splitting rows into lists of at most batch_size rows"""
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
     def add_course(self, id, name, description='', link='', fields=dict()):
         """Returns True if course successfully added"""
         queries_and_params = [(INSERT_COURSE_QUERY, (id, name, description, link))]
         for field, value in fields.items():
             queries_and_params.append((INSERT_COURSE_FIELDS_QUERY, (id, field, value)))
-        return self._execute_queries(queries_and_params) is not None
+        queries_and_params.append((INSERT_COURSE_SEARCH_BY_ID, (id,)))
+        if self._execute_queries(queries_and_params) is None:
+            return False
+        self._bump_catalog_version()
+        return True
 
     def generate_prereq_courses(prerequisites):
         """Generator object for recursively returning courses in a prerequisite tree"""
@@ -182,15 +750,29 @@ class SqlDb:
 
     def add_prerequisites(self, course_id, prerequisites):
         """Returns True if prerequisites successfully added"""
-        if self._execute_query(INSERT_COURSE_PREREQS_QUERY, (course_id, json.dumps(prerequisites))) is None:
-            return False
-        for prereq_id in SqlDb.generate_prereq_courses(prerequisites):
-            # Silence warnings, since some prerequisite courses may not exist anymore
-            self._execute_query(INSERT_COURSE_PRE_POST_REQ_SCHEMA_QUERY, (course_id, prereq_id), verbose=False)
+        with self.transaction():
+            if self._execute_query(INSERT_COURSE_PREREQS_QUERY, (course_id, json.dumps(prerequisites))) is None:
+                return False
+            for prereq_id in SqlDb.generate_prereq_courses(prerequisites):
+                # Silence warnings, since some prerequisite courses may not exist anymore
+                if self._execute_query(INSERT_COURSE_PRE_POST_REQ_SCHEMA_QUERY, (course_id, prereq_id), verbose=False) is not None:
+                    # Update closure incrementally with new relation
+                    self._execute_query(INSERT_COURSE_CLOSURE_EDGE_QUERY, (prereq_id, prereq_id, course_id, course_id))
+            self._bump_catalog_version()
         return True
 
+    def _bump_catalog_version(self):
+        """Increments catalog version, so that cached course data built from older versions is reloaded"""
+        version = self._con.execute(GET_CATALOG_VERSION.format(schema=self._catalog)).fetchone()[0]
+        self._con.execute(SET_CATALOG_VERSION.format(schema=self._catalog, version=version + 1))
+        self._snapshot_current = None
+        self._commit()
+
     def add_review(self, course_id, username, rating, content, timestamp=None):
         """Returns True if review successfully added"""
+        # Course may be in another database, so it is checked here instead of with a foreign key
+        if self._execute_read(GET_COURSE_EXISTS, (course_id,)).fetchone() is None:
+            return False
         if timestamp is None:
             return self._execute_query(INSERT_REVIEW_QUERY, (course_id, username, rating, content)) is not None
         return self._execute_query(INSERT_REVIEW_CUSTOM_DATE, (timestamp, course_id, username, rating, content)) is not None
@@ -199,6 +781,36 @@ class SqlDb:
         """Returns True if review successfully edited"""
         return self._execute_query(UPDATE_REVIEW_QUERY, (rating, content, course_id, username)) is not None
 
+    def upsert_review(self, course_id, username, rating, content):
+        """Adds review by user on course, or replaces their existing review, in a single statement.
+        Review statistics are updated by triggers in the same transaction.
+        Returns resulting review, or None if course does not exist or review is invalid
+
+        Return Schema:
+        {
+            "review_id": Unique id of Review,
+            "timestamp": Timestamp of Review in Unix Epoch,
+            "username": Username of Review Creator,
+            "rating": Rating of Review, on a scale of 0-10 (inclusive)
+            "content": Additional comments of review
+        }
+        """
+        try:
+            # Returned row is read before committing, since statement is still in progress until then
+            result = self._con.execute(UPSERT_REVIEW_QUERY, {"course_id": course_id, "username": username,
+                                                             "rating": rating, "content": content}).fetchone()
+            self._commit()
+        except sqlite3.IntegrityError as e:
+            print(e)
+            print(f"Could not submit review of {course_id} by {username}")
+            return None
+        if result is not None:
+            return {"review_id": result[0],
+                    "timestamp": result[1],
+                    "username": result[3],
+                    "rating": result[4],
+                    "content": result[5]}
+
     def delete_review(self, course_id, username):
         """Returns True if review successfully deleted"""
         return self._execute_query(DELETE_REVIEW_QUERY, (course_id, username)) is not None
@@ -206,13 +818,14 @@ class SqlDb:
     ### Get user data
     def get_password(self, username):
         """Returns password associated with username, or None if username not in database"""
-        query = self._execute_query(GET_USER_BY_USERNAME, (username,))
+        query = self._execute_read(GET_USER_BY_USERNAME, (username,))
         if query is not None and (result := query.fetchone()) is not None:
             return result[1]
 
-    def get_user_reviews(self, username, limit=-1):
+    def get_user_reviews(self, username, limit=-1, after=None):
         """
-        Returns list of reviews posted by a user
+        Returns list of reviews posted by a user, newest first,
+        starting after review with (timestamp, review id) after if given
 
         Return Schema:
         [
@@ -225,7 +838,10 @@ class SqlDb:
             }
         ]
         """
-        query = self._execute_query(GET_REVIEW_BY_USERNAME, (username, limit))
+        if after is None:
+            query = self._execute_read(GET_REVIEW_BY_USERNAME, (username, limit))
+        else:
+            query = self._execute_read(GET_REVIEW_BY_USERNAME_AFTER, (username, *after, limit))
         if query is not None:
             return [{"review_id": row[0],
                      "timestamp": row[1],
@@ -235,9 +851,14 @@ class SqlDb:
 
 
     ### Get course data
-    def get_courses(self, limit=-1):
-        """Returns list of ids of all courses in database"""
-        query=self._execute_query(GET_COURSE_IDS, (limit,))
+    def get_courses(self, limit=-1, after=None):
+        """Returns list of ids of all courses in database in alphabetical order, starting after course id after if given"""
+        if (snapshot := self._get_snapshot()) is not None:
+            return snapshot.get_courses(limit, after)
+        if after is None:
+            query = self._execute_read(GET_COURSE_IDS, (limit,))
+        else:
+            query = self._execute_read(GET_COURSE_IDS_AFTER, (after, limit))
         if query is not None:
             return [row[0] for row in query]
 
@@ -249,7 +870,7 @@ class SqlDb:
             (Course Id, Number of Users)
         ]
         """
-        query = self._execute_query(GET_COURSE_ORDER_BY_REVIEWS, (limit,))
+        query = self._execute_read(GET_COURSE_ORDER_BY_REVIEWS, (limit,))
         if query is not None:
             return [(row[0], row[1]) for row in query]
 
@@ -261,10 +882,27 @@ class SqlDb:
             (Course Id, Average Rating)
         ]
         """
-        query = self._execute_query(GET_COURSE_ORDER_BY_AVERAGE_RATING, (limit,))
+        query = self._execute_read(GET_COURSE_ORDER_BY_AVERAGE_RATING, (limit,))
         if query is not None:
             return [(row[0], row[1]) for row in query]
 
+    def create_search_query(text):
+        """Returns FTS5 query matching courses containing every word of text, where words may be incomplete"""
+        # Words are quoted so that FTS5 operators and punctuation in text are matched literally
+        return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text))
+
+    def search_courses(self, text, limit=SEARCH_RESULTS_SIZE):
+        """Returns courses whose code, name, description or fields contain every word of text, best matches first
+
+        Return Schema:
+        [
+            (Course Id, Course Name)
+        ]
+        """
+        if not (query := SqlDb.create_search_query(text)):
+            return []
+        return [(row[0], row[1]) for row in self._execute_read(SEARCH_COURSES_QUERY, (query, limit))]
+
 
     ### Get Data for Single Course
     def get_course_basic_info(self, course):
@@ -277,7 +915,9 @@ class SqlDb:
             "link": Course Link
         }
         """
-        course_query = self._execute_query(GET_COURSE_BY_ID, (course,))
+        if (snapshot := self._get_snapshot()) is not None:
+            return snapshot.get_course_basic_info(course)
+        course_query = self._execute_read(GET_COURSE_BY_ID, (course,))
         if course_query is not None and (course_results := course_query.fetchone()) is not None:
             return {"name": course_results[1],
                     "description": course_results[2],
@@ -298,17 +938,20 @@ class SqlDb:
             ]
         }
         """
+        if (snapshot := self._get_snapshot()) is not None:
+            return snapshot.get_course_full_info(course)
         info = self.get_course_basic_info(course)
         if info is not None:
-            course_field_query = self._execute_query(GET_COURSE_FIELDS_BY_ID, (course,))
+            course_field_query = self._execute_read(GET_COURSE_FIELDS_BY_ID, (course,))
             course_field_results = course_field_query.fetchall() if course_field_query is not None else []
             info["fields"] = [{"name": row[0],
                                "value": row[1]
                               } for row in course_field_results]
             return info
 
-    def get_course_reviews(self, course, limit=-1):
-        """Returns list of reviews about course in format
+    def get_course_reviews(self, course, limit=-1, after=None):
+        """Returns list of reviews about course, newest first,
+        starting after review with (timestamp, review id) after if given
 
         Return Schema:
         [
@@ -321,7 +964,10 @@ class SqlDb:
             }
         ]
         """
-        query = self._execute_query(GET_REVIEW_BY_COURSE_ID, (course, limit))
+        if after is None:
+            query = self._execute_read(GET_REVIEW_BY_COURSE_ID, (course, limit))
+        else:
+            query = self._execute_read(GET_REVIEW_BY_COURSE_ID_AFTER, (course, *after, limit))
         if query is not None:
             return [{"review_id": row[0],
                      "timestamp": row[1],
@@ -329,6 +975,43 @@ class SqlDb:
                      "rating": row[4],
                      "content": row[5]} for row in query]
 
+    def get_course_page(self, course, username=None, limit=-1, after=None):
+        """Returns everything shown on page of course with one query, with reviews starting after
+        review with (timestamp, review id) after if given, or None if course not in database
+
+        Return Schema:
+        {
+            "info": Full course information (see get_course_full_info),
+            "reviews": [list of reviews] (see get_course_reviews),
+            "review_count": Number of reviews of course,
+            "rating": Average rating of reviews of course, or None if no reviews,
+            "user_review": Review of course by username (see get_course_review), or None if no such review
+        }
+        """
+        params = {"course": course, "username": username, "limit": limit}
+        if after is None:
+            query = self._execute_read(GET_COURSE_PAGE, params)
+        else:
+            params["timestamp"], params["review_id"] = after
+            query = self._execute_read(GET_COURSE_PAGE_AFTER, params)
+        if query is None or (result := query.fetchone()) is None:
+            return None
+
+        def create_review(row):
+            return {"review_id": row[0],
+                    "timestamp": row[1],
+                    "username": row[2],
+                    "rating": row[3],
+                    "content": row[4]}
+        return {"info": {"name": result[0],
+                         "description": result[1],
+                         "link": result[2],
+                         "fields": [{"name": row[0], "value": row[1]} for row in json.loads(result[3])]},
+                "reviews": [create_review(row) for row in json.loads(result[4])],
+                "review_count": result[5] or 0,
+                "rating": result[6],
+                "user_review": create_review(json.loads(result[7])) if result[7] is not None else None}
+
     def get_course_review(self, course, user):
         """
         Returns review by user on course in format, or None if no such review
@@ -342,7 +1025,7 @@ class SqlDb:
             "content": Additional comments of review
         }
         """
-        query = self._execute_query(GET_REVIEW_BY_COURSE_ID_AND_USERNAME, (course, user))
+        query = self._execute_read(GET_REVIEW_BY_COURSE_ID_AND_USERNAME, (course, user))
         if query is not None and (result := query.fetchone()) is not None:
             return {"review_id": result[0],
                     "timestamp": result[1],
@@ -352,10 +1035,17 @@ class SqlDb:
 
     def get_course_average_rating(self, course):
         """Returns average rating of reviews of course, or None if no reviews"""
-        query = self._execute_query(GET_COURSE_AVERAGE_RATING, (course,))
+        query = self._execute_read(GET_COURSE_AVERAGE_RATING, (course,))
         if query is not None and (result := query.fetchone()) is not None:
             return result[0]
 
+    def get_course_rating_counts(self, course):
+        """Returns number of reviews of course with each rating, indexed by rating from 0 to 10"""
+        counts = [0] * 11
+        for rating, count in self._execute_read(GET_COURSE_RATING_COUNTS_BY_ID, (course,)):
+            counts[rating] = count
+        return counts
+
     def get_course_prereqs(self, course):
         """Returns dictionary representing course prerequisites structure
 
@@ -367,54 +1057,148 @@ class SqlDb:
             ]
         }
         """
-        query = self._execute_query(GET_COURSE_PREREQS_BY_ID, (course,))
+        if (snapshot := self._get_snapshot()) is not None:
+            return snapshot.get_course_prereqs(course)
+        query = self._execute_read(GET_COURSE_PREREQS_BY_ID, (course,))
         if query is not None and (result := query.fetchone()) is not None:
             return json.loads(result[0])
 
+    def get_all_course_prereqs(self):
+        """Returns prerequisites structure of every course with prerequisites data
+
+        Return Schema:
+        [
+            (Course Id, Prerequisites Structure)
+        ]
+        """
+        if (snapshot := self._get_snapshot()) is not None:
+            return snapshot.get_all_course_prereqs()
+        query = self._execute_read(GET_ALL_COURSE_PREREQS)
+        if query is not None:
+            return [(row[0], json.loads(row[1])) for row in query]
+
     def get_prereq_courses(self, course):
         """Returns list of prerequisite courses of course"""
-        query = self._execute_query(GET_PREREQ_COURSES_BY_COURSE_ID, (course,))
+        if (snapshot := self._get_snapshot()) is not None:
+            return snapshot.get_prereq_courses(course)
+        query = self._execute_read(GET_PREREQ_COURSES_BY_COURSE_ID, (course,))
         if query is not None:
             return [row[1] for row in query]
 
     def get_postreq_courses(self, course):
         """Returns list of postrequisite courses of course"""
-        query = self._execute_query(GET_POSTREQ_COURSES_BY_COURSE_ID, (course,))
+        if (snapshot := self._get_snapshot()) is not None:
+            return snapshot.get_postreq_courses(course)
+        query = self._execute_read(GET_POSTREQ_COURSES_BY_COURSE_ID, (course,))
+        if query is not None:
+            return [row[0] for row in query]
+
+    def get_requisite_edges(self):
+        """Returns list of all prerequisite relations between courses
+
+        Return Schema:
+        [
+            (Postrequisite Course Id, Prerequisite Course Id)
+        ]
+        """
+        if (snapshot := self._get_snapshot()) is not None:
+            return snapshot.get_requisite_edges()
+        query = self._execute_read(GET_REQUISITE_EDGES)
+        if query is not None:
+            return [(row[0], row[1]) for row in query]
+
+    def get_course_ancestors(self, course):
+        """Returns list of all direct and indirect prerequisite courses of course"""
+        query = self._execute_read(GET_COURSE_ANCESTORS_BY_COURSE_ID, (course,))
         if query is not None:
             return [row[0] for row in query]
 
+    def get_course_descendants(self, course):
+        """Returns list of all courses that directly or indirectly require course"""
+        query = self._execute_read(GET_COURSE_DESCENDANTS_BY_COURSE_ID, (course,))
+        if query is not None:
+            return [row[0] for row in query]
+
+    def get_course_closure(self):
+        """Returns list of all pairs of courses where one is a direct or indirect prerequisite of the other
+
+        Return Schema:
+        [
+            (Prerequisite Course Id, Postrequisite Course Id)
+        ]
+        """
+        query = self._execute_read(GET_COURSE_CLOSURE)
+        if query is not None:
+            return [(row[0], row[1]) for row in query]
+
+    def get_catalog_version(self):
+        """Returns version stamp of course data, which changes whenever course data is re-imported
+
+        Return Schema:
+        (Database File, Version Number)
+        """
+        return (self._catalog_file, self._con.execute(GET_CATALOG_VERSION.format(schema=self._catalog)).fetchone()[0])
+
+    def _get_snapshot(self):
+        """Returns catalog snapshot if it matches course data in database, otherwise None.
+        Version is only compared once, since SqlDb objects of the site only live for one request
+        """
+        # Transactions may be changing course data, so they always read the database itself
+        if self._snapshot is None or self._transaction_depth > 0:
+            return None
+        if self._snapshot_current is None:
+            self._snapshot_current = self._snapshot.version == self.get_catalog_version()[1]
+        if self._snapshot_current:
+            return self._snapshot
+
 
     ### Database Manipulation
     def _create_user_tables(self):
         """Creates user-related tables in database"""
         self._con.execute(f"CREATE TABLE IF NOT EXISTS {USER_SCHEMA}")
         self._con.execute(f"CREATE TABLE IF NOT EXISTS {REVIEW_SCHEMA}")
+        self._con.execute(f"CREATE TABLE IF NOT EXISTS {COURSE_STATS_SCHEMA}")
+        self._con.execute(f"CREATE TABLE IF NOT EXISTS {COURSE_RATING_COUNTS_SCHEMA}")
+        for index in USER_INDEXES:
+            self._con.execute(f"CREATE INDEX IF NOT EXISTS {index}")
+        self._con.execute(f"CREATE TRIGGER IF NOT EXISTS {REVIEW_INSERT_STATS_TRIGGER}")
+        self._con.execute(f"CREATE TRIGGER IF NOT EXISTS {REVIEW_DELETE_STATS_TRIGGER}")
+        self._con.execute(f"CREATE TRIGGER IF NOT EXISTS {REVIEW_UPDATE_STATS_TRIGGER}")
         self._commit()
 
     def _create_course_tables(self):
         """Creates course-related tables in database"""
-        self._con.execute(f"CREATE TABLE IF NOT EXISTS {COURSE_SCHEMA}")
-        self._con.execute(f"CREATE TABLE IF NOT EXISTS {COURSE_FIELDS_SCHEMA}")
-        self._con.execute(f"CREATE TABLE IF NOT EXISTS {COURSE_PREREQS_SCHEMA}")
-        self._con.execute(f"CREATE TABLE IF NOT EXISTS {COURSE_PRE_POST_REQ_SCHEMA}")
+        # Course tables are created in catalog database, which may be attached to this one
+        self._con.execute(f"CREATE TABLE IF NOT EXISTS {self._catalog}.{COURSE_SCHEMA.strip()}")
+        self._con.execute(f"CREATE TABLE IF NOT EXISTS {self._catalog}.{COURSE_FIELDS_SCHEMA.strip()}")
+        self._con.execute(f"CREATE TABLE IF NOT EXISTS {self._catalog}.{COURSE_PREREQS_SCHEMA.strip()}")
+        self._con.execute(f"CREATE TABLE IF NOT EXISTS {self._catalog}.{COURSE_PRE_POST_REQ_SCHEMA.strip()}")
+        self._con.execute(f"CREATE TABLE IF NOT EXISTS {self._catalog}.{COURSE_CLOSURE_SCHEMA.strip()}")
+        self._con.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {self._catalog}.{COURSE_SEARCH_SCHEMA.strip()}")
+        for index in COURSE_INDEXES:
+            self._con.execute(f"CREATE INDEX IF NOT EXISTS {self._catalog}.{index.strip()}")
         self._commit()
 
     def _drop_user_tables(self):
         """Drops all user-related tables in database"""
+        self._con.execute("DROP TABLE IF EXISTS CourseRatingCounts")
+        self._con.execute("DROP TABLE IF EXISTS CourseStats")
         self._con.execute("DROP TABLE IF EXISTS Review")
         self._con.execute("DROP TABLE IF EXISTS User")
         self._commit()
 
     def _drop_course_tables(self):
         """Drops course-related tables in database"""
-        self._con.execute("DROP TABLE IF EXISTS CoursePrePostReq")
-        self._con.execute("DROP TABLE IF EXISTS CoursePrereqs")
-        self._con.execute("DROP TABLE IF EXISTS CourseFields")
-        self._con.execute("DROP TABLE IF EXISTS Course")
+        for table in ['CourseSearch', 'CourseClosure', 'CoursePrePostReq', 'CoursePrereqs', 'CourseFields', 'Course']:
+            self._con.execute(f"DROP TABLE IF EXISTS {self._catalog}.{table}")
         self._commit()
 
+    def _execute_read(self, query, params=[]):
+        """Executes read-only query and returns cursor, without committing"""
+        return self._con.execute(query, params)
+
     def _execute_query(self, query, params=[], verbose=True):
-        """Attempts to execute query, returning cursor if successful and None if unsuccessful"""
+        """Attempts to execute write query, returning cursor if successful and None if unsuccessful"""
         try:
             cur = self._con.execute(query, params)
             self._commit()
@@ -426,34 +1210,128 @@ class SqlDb:
             return None
 
     def _execute_queries(self, queries_and_params):
-        """Attempts to execute queries, returning array of cursors if successful and None if unsuccessful"""
+        """Attempts to execute write queries, returning array of cursors if successful and None if unsuccessful"""
         curs = []
+        # Savepoint only undoes these queries if one fails, even inside a larger transaction scope
+        self._con.execute("SAVEPOINT execute_queries")
         for query, params in queries_and_params:
             try:
                 curs.append(self._con.execute(query, params))
             except sqlite3.IntegrityError as e:
                 print(e)
                 print(f"Could not execute \"{query}\" from list of queries with parameters {params}")
-                self._rollback()
+                self._con.execute("ROLLBACK TO execute_queries")
+                self._con.execute("RELEASE execute_queries")
                 return None
+        self._con.execute("RELEASE execute_queries")
         self._commit()
         return curs
 
 
+### Split Databases
+@contextmanager
+def update_catalog(user_file=USER_FILE, catalog_file=CATALOG_FILE):
+    """Context manager yielding database whose course data is a writable copy of catalog,
+    which atomically replaces catalog once the block exits without an exception.
+    Processes reading the old catalog keep reading it until they open new connections
+    """
+    temp_file = f"{catalog_file}.tmp"
+    if os.path.exists(catalog_file):
+        shutil.copyfile(catalog_file, temp_file)
+    elif os.path.exists(temp_file):
+        os.remove(temp_file)
+    db = SqlDb(user_file, catalog_file=temp_file, catalog_writable=True)
+    try:
+        db.migrate_catalog()
+        # Changes made in block are committed together, even by statements that do not commit themselves
+        with db.transaction():
+            yield db
+    except BaseException:
+        db.close()
+        os.remove(temp_file)
+        raise
+    db.close()
+    os.replace(temp_file, catalog_file)
+
+    # Review statistics are kept for every course in the new catalog
+    db = SqlDb(user_file, catalog_file=catalog_file)
+    db.migrate_user()
+    db.close()
+
+def split_database(legacy_file=LEGACY_FILE, user_file=USER_FILE, catalog_file=CATALOG_FILE):
+    """Copies course data and user data of database created by an older version of the site into separate databases,
+    leaving legacy database unchanged. Returns False if split databases already exist
+    """
+    if os.path.exists(user_file) or os.path.exists(catalog_file):
+        print(f"Not splitting {legacy_file}, since {user_file} or {catalog_file} already exists")
+        return False
+    legacy = f"file:{quote(os.path.abspath(legacy_file))}?mode=ro"
+
+    # Catalog keeps rollback journal mode, since it is opened as immutable and a write-ahead log would be ignored
+    temp_file = f"{catalog_file}.tmp"
+    if os.path.exists(temp_file):
+        os.remove(temp_file)
+    db = SqlDb(temp_file)
+    db._con.execute("ATTACH DATABASE ? AS legacy", (legacy,))
+    with db.transaction():
+        db._create_course_tables()
+        for table in LEGACY_COURSE_TABLES:
+            db._con.execute(f"INSERT INTO main.{table} SELECT * FROM legacy.{table}")
+        # Version continues from legacy database, so that caches built from it are not mistaken for the new catalog
+        version = db._con.execute(GET_CATALOG_VERSION.format(schema='legacy')).fetchone()[0]
+        db._con.execute(SET_CATALOG_VERSION.format(schema='main', version=version))
+        db.rebuild_course_closure()
+        db.rebuild_course_search()
+    db._con.execute("DETACH DATABASE legacy")
+    db.close()
+    os.replace(temp_file, catalog_file)
+
+    temp_file = f"{user_file}.tmp"
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(temp_file + suffix):
+            os.remove(temp_file + suffix)
+    db = SqlDb(temp_file, catalog_file=catalog_file)
+    db._con.execute("ATTACH DATABASE ? AS legacy", (legacy,))
+    with db.transaction():
+        db._create_user_tables()
+        # Review statistics are filled in by triggers as reviews are copied
+        for table in LEGACY_USER_TABLES:
+            db._con.execute(f"INSERT INTO main.{table} SELECT * FROM legacy.{table}")
+    db._con.execute("DETACH DATABASE legacy")
+    db.migrate_user()
+    db.close()
+    os.replace(temp_file, user_file)
+    return True
+
+
 # Callable functions for maintenance and testing purposes
 def get_db():
-    return SqlDb("database.db")
+    return SqlDb(USER_FILE, catalog_file=CATALOG_FILE)
+
+def split_db():
+    # Moves data of database.db created by older versions of the site into separate catalog and user databases
+    if split_database():
+        db = get_db()
+        print(f"Split {LEGACY_FILE} into {CATALOG_FILE} ({len(db.get_courses())} courses) and {USER_FILE}")
 
 def reset_users():
     db = get_db()
     db.reset_user_db()
 
-def reset_courses():
-    # Note: Also resets user data due to foreign key dependencies
-    db = get_db()
-    db.reset_user_db()
-    db.reset_course_db()
-    db.insert_course_data(COURSES_FILE, PREREQUISITES_FILE)
+def reset_courses(bulk=True):
+    # Reviews of courses that no longer exist are kept, since they are in a separate database
+    with update_catalog() as db:
+        db.reset_course_db()
+        if bulk:
+            db.bulk_insert_course_data(COURSES_FILE, PREREQUISITES_FILE)
+        else:
+            db.insert_course_data(COURSES_FILE, PREREQUISITES_FILE)
+
+def refresh_courses():
+    # Only applies changes in course data, keeping user data
+    with update_catalog() as db:
+        for table, (inserted, updated, deleted) in db.sync_course_data(COURSES_FILE, PREREQUISITES_FILE).items():
+            print(f"{table}: {inserted} inserted, {updated} updated, {deleted} deleted")
 
 def reset_db():
     reset_courses()
@@ -472,16 +1350,104 @@ def test_queries():
         (" - Prerequisites of CSCA48H3: ", db.get_prereq_courses('CSCA48H3')),
         (" - Prerequisites of MATA31H3: ", db.get_prereq_courses('MATA31H3')),
         (" - Postrequisites of CSCA48H3: ", db.get_postreq_courses('CSCA48H3')),
+        (" - All Prerequisites of CSCC73H3: ", db.get_course_ancestors('CSCC73H3')),
+        (" - All Postrequisites of CSCA48H3: ", db.get_course_descendants('CSCA48H3')),
         (" - Reviews of CSCB20H3: ", db.get_course_reviews('CSCB20H3')),
         (" - Review of CSCB20H3 by user 'admin': ", db.get_course_review('CSCB20H3', 'admin')),
         (" - Average Rating of CSCB20H3: ", db.get_course_average_rating('CSCB20H3')),
+        (" - Page of CSCB20H3 for user 'admin': ", db.get_course_page('CSCB20H3', 'admin', 5)),
         (" - Average Rating of MATA31H3: ", db.get_course_average_rating('MATA31H3')),
+        (" - Rating Counts of CSCB20H3: ", db.get_course_rating_counts('CSCB20H3')),
         (" - Top 10 Courses by Reviews: ", db.get_courses_order_by_reviews(10)),
-        (" - Top 10 Courses by Rating: ", db.get_courses_order_by_average_rating(10))
+        (" - Top 10 Courses by Rating: ", db.get_courses_order_by_average_rating(10)),
+        (" - Search for 'linear alg': ", db.search_courses('linear alg', 5))
     ]
     for test, result in tests:
         print(test + str(result))
 
+def test_query_plans():
+    """Checks that every table a query reads is searched through an index, except for queries in FULL_SCAN_QUERIES"""
+    db = get_db()
+    db.migrate_user()
+    # Templates that other queries are formatted from are skipped
+    queries = [(name, value) for name, value in globals().items()
+               if name.isupper() and type(value) == str and '{' not in value
+               and value.split(maxsplit=1)[:1] in (['SELECT'], ['INSERT'], ['UPDATE'], ['DELETE'], ['WITH'])]
+    tables = {row[0] for row in db._con.execute(f"SELECT name FROM sqlite_master WHERE type='table' UNION "
+                                                f"SELECT name FROM {db._catalog}.sqlite_master WHERE type='table'")}
+    failed = []
+    for name, query in queries:
+        # Parameters do not affect query plan, so all of them are NULL
+        params = {name: None for name in re.findall(r':(\w+)', query)} or [None] * query.count('?')
+        plan = db._con.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+        # Scans of subqueries and constant rows are fine, while scanning a table is not, even in order of one of its indexes.
+        # Virtual tables report a scan too, which only reads part of table if it passes a constraint through its index number or string
+        scans = [row[3] for row in plan if row[3].startswith('SCAN ') and row[3].split()[1] in tables
+                 and not re.search(r' VIRTUAL TABLE INDEX (?!0:$)\d+:', row[3])]
+        if scans and name not in FULL_SCAN_QUERIES:
+            failed.append(name)
+            print(f" - {name}: {', '.join(scans)}")
+    print(f"Total full scans: {len(failed)}/{len(queries)}")
+    assert not failed, f"Queries scan entire tables: {', '.join(failed)}"
+
+def test_connection_pool_fork():
+    """Checks that a process forked while the pool holds idle connections never gets back the parent's connection"""
+    pool = ConnectionPool(USER_FILE, CATALOG_FILE)
+    con = pool.acquire()
+    pool.release(con)
+    pid = os.fork()
+    if pid == 0:
+        # Exit code of child tells parent whether check passed, without running parent's cleanup
+        child_con = pool.acquire()
+        reused = child_con is con
+        healthy = pool._is_healthy(child_con)
+        pool.release(child_con)
+        pool.close()
+        os._exit(0 if healthy and not reused else 1)
+    _, status = os.waitpid(pid, 0)
+    # Parent's connection must still be usable after child discarded its copy
+    parent_con = pool.acquire()
+    kept = parent_con is con and pool._is_healthy(parent_con)
+    pool.release(parent_con)
+    pool.close()
+    print(f"Forked child reused parent connection: {os.waitstatus_to_exitcode(status) != 0}, parent connection kept: {kept}")
+    assert os.waitstatus_to_exitcode(status) == 0, "Forked child got connection opened by parent"
+    assert kept, "Parent connection was not kept after fork"
+
+def test_sync_course_data():
+    """Checks that sync keeps a reviewed course that left data files, when a course it requires is deleted"""
+    with tempfile.TemporaryDirectory() as directory:
+        user_file, catalog_file = os.path.join(directory, 'users.db'), os.path.join(directory, 'catalog.db')
+        courses_file, prerequisites_file = os.path.join(directory, 'courses.json'), os.path.join(directory, 'prerequisites.json')
+
+        def sync(courses, prereqs):
+            with open(courses_file, 'w') as f:
+                json.dump([{'code': code, 'name': code, 'description': '', 'link': '', 'fields': dict()} for code in courses], f)
+            with open(prerequisites_file, 'w') as f:
+                json.dump([{'code': code, 'prereqs': expression} for code, expression in prereqs.items()], f)
+            with update_catalog(user_file, catalog_file) as db:
+                return db.sync_course_data(courses_file, prerequisites_file)
+
+        # Empty catalog and user tables are created first, like when the site starts without any database
+        with update_catalog(user_file, catalog_file):
+            pass
+        sync(['AAAA01H3', 'AAAB01H3', 'AAAC01H3'], {'AAAB01H3': 'AAAA01H3', 'AAAC01H3': 'AAAB01H3'})
+        db = SqlDb(user_file, catalog_file=catalog_file)
+        db.add_user('user', 'password')
+        db.add_review('AAAB01H3', 'user', 5, '')
+        db.close()
+        # AAAB01H3 is kept for its review, while AAAA01H3 which it requires is deleted
+        changes = sync(['AAAC01H3'], {'AAAC01H3': 'AAAB01H3'})
+        db = SqlDb(user_file, catalog_file=catalog_file)
+        courses, edges, ancestors = db.get_courses(), db.get_requisite_edges(), db.get_course_ancestors('AAAC01H3')
+        db.close()
+    print(f"Changes: {changes}\nCourses: {courses}, relations: {edges}, ancestors of AAAC01H3: {ancestors}")
+    assert courses == ['AAAB01H3', 'AAAC01H3'], "Reviewed course was not kept"
+    assert edges == [('AAAC01H3', 'AAAB01H3')] and ancestors == ['AAAB01H3'], "Relation to deleted course was kept"
+
 
 if __name__ == "__main__":
     test_queries()
+    test_query_plans()
+    test_connection_pool_fork()
+    test_sync_course_data()
@@ -23,11 +23,17 @@ const svg = container.append("svg")
   .attr("viewBox", `0 0 ${width} ${height}`)
   .classed("svg-content-responsive", true);
 
+// Use node coordinates computed by the server when available instead of simulating forces
+const hasLayout = typeof layout !== "undefined" && layout !== null;
+
 // Create d3 simulation
 const simulation = d3.forceSimulation()
-  .force("link", d3.forceLink().id(d => d.id).distance(100)) // Linked objects pull towards each other
-  .force("collide", d3.forceCollide(radius*1.8)) // Objects have collision plus "invisible" boundary
-  .force("center", d3.forceCenter(width / 2, height / 2)); // Objects gather in center
+  .force("link", d3.forceLink().id(d => d.id).distance(100)); // Linked objects pull towards each other
+if (!hasLayout) {
+  simulation
+    .force("collide", d3.forceCollide(radius*1.8)) // Objects have collision plus "invisible" boundary
+    .force("center", d3.forceCenter(width / 2, height / 2)); // Objects gather in center
+}
 
 
 // Arrow marker definition
@@ -47,7 +53,12 @@ svg.append("svg:defs").selectAll("marker")
   .attr("class", "arrow");
 
 // Create data objects for graphical representation of tree
-const nodes = Object.keys(data).map(key => ({
+const nodes = Object.keys(data).map(key => (hasLayout && layout[key] ? {
+  id: key,
+  // Scale coordinates from [0, 1] to canvas and pin nodes there
+  fx: padding + layout[key][0] * (width - 2 * padding),
+  fy: padding + layout[key][1] * (height - 2 * padding)
+} : {
   id: key
 }));
 const links = nodes.flatMap(node => (data[node.id] || []).map(target => ({ source: node.id, target })));
@@ -99,6 +110,16 @@ simulation.nodes(nodes)
 // Link objects together in simulation
 simulation.force("link")
   .links(links);
+
+// Nodes are already in place, so draw them once instead of running the simulation
+if (hasLayout) {
+  simulation.stop();
+  nodes.forEach(node => {
+    node.x = node.fx;
+    node.y = node.fy;
+  });
+  ticked();
+}
   
 // Function for moving objects per tick
 function ticked() {
@@ -131,6 +152,9 @@ function dragged(event, d) {
 
 function dragended(event, d) {
   if (!event.active) simulation.alphaTarget(0);
-  d.fx = null;
-  d.fy = null;
+  // Nodes placed by the server stay where they are dropped
+  if (!hasLayout) {
+    d.fx = null;
+    d.fy = null;
+  }
 }
@@ -6,37 +6,80 @@ var tooltipList = tooltipTriggerList.map(function (tooltipTriggerEl) {
 
 // Courses Search Bar
 const coursesSearchBar = document.querySelector("#form-courses-search-bar");
-const coursesList = document.querySelectorAll(".form-courses-check");
+const coursesSuggestions = document.querySelector("#form-courses-suggestions");
+const coursesSelected = document.querySelector("#form-courses-selected");
+const departments = coursesSuggestions.dataset.departments.split(",");
+let suggestRequest = null;
 
-// Run function when key is pressed
-coursesSearchBar.addEventListener("keyup", filterFactory(coursesList,
-	// Filtering function
-	courseElement => {
-		const text = coursesSearchBar.value.toUpperCase();
-		// Show all elements if search bar is empty
-		if (!text) {
-			return false;
+// Add checked checkbox for course to selected courses, unless already selected
+function selectCourse(course) {
+	if (document.getElementById(`form-courses-${course}`)) {
+		return;
+	}
+	const courseElement = document.createElement("div");
+	courseElement.className = "form-courses-check";
+	const input = document.createElement("input");
+	input.type = "checkbox";
+	input.id = `form-courses-${course}`;
+	input.name = "courses";
+	input.value = course;
+	input.checked = true;
+	const label = document.createElement("label");
+	label.htmlFor = input.id;
+	label.textContent = course;
+	courseElement.append(input, label);
+	coursesSelected.appendChild(courseElement);
+}
+
+// Replace suggestions with buttons selecting each suggested course
+function showSuggestions(courses) {
+	const buttons = courses.map(course => {
+		const button = document.createElement("button");
+		button.type = "button";
+		button.className = "btn btn-outline-primary btn-sm me-1 mb-1";
+		button.textContent = course;
+		button.addEventListener("click", () => selectCourse(course));
+		return button;
+	});
+	coursesSuggestions.replaceChildren(...buttons);
+}
+
+// Fetch courses starting with search bar text from server
+function suggestCourses() {
+	if (suggestRequest) {
+		suggestRequest.abort();
+	}
+	suggestRequest = new AbortController();
+	const params = new URLSearchParams({q: coursesSearchBar.value.trim()});
+	for (const department of departments) {
+		params.append("department", department);
+	}
+	fetch("/api/courses/suggest?" + params, {signal: suggestRequest.signal})
+		.then(response => response.json())
+		.then(data => showSuggestions(data.courses))
+		.catch(error => {
+			// Suggestions replaced by newer suggestions are aborted
+			if (error.name !== "AbortError") {
+				console.error(error);
+			}
+		});
+}
+
+coursesSearchBar.addEventListener("input", suggestCourses);
+// Pressing enter selects first suggestion instead of submitting form
+coursesSearchBar.addEventListener("keydown", event => {
+	if (event.key === "Enter") {
+		event.preventDefault();
+		const firstSuggestion = coursesSuggestions.querySelector("button");
+		if (firstSuggestion) {
+			firstSuggestion.click();
 		}
-		const label = courseElement.querySelector("label");
-		const courseCode = label.textContent || label.innerText;
-		// Show element if search bar text appears anywhere in course code
-		return courseCode.toUpperCase().indexOf(text) <= -1;
-	},
-	// Show element function
-	courseElement => {
-		courseElement.style.display = "";
-	},
-	// Hide element function
-	courseElement => {
-		courseElement.style.display = "none";
 	}
-));
+});
+suggestCourses();
 
 // Selected Clear Button
 const coursesClearButton = document.querySelector("#form-courses-clear");
 coursesClearButton.addEventListener("click", () => {
-	// Show every element
-	for (courseElement of coursesList) {
-		courseElement.querySelector("input").checked = false;
-	}
+	coursesSelected.replaceChildren();
 });
@@ -6,27 +6,62 @@ for (const course of coursesList) {
 
 // Courses Search Bar
 const coursesSearchBar = document.querySelector("#search-bar-courses");
+const coursesListPage = document.querySelector("#courses-list-page");
+const searchResults = document.querySelector("#search-results");
+const searchResultsBody = searchResults.querySelector("tbody");
+// Milliseconds to wait after last key press before searching
+const SEARCH_DELAY = 150;
+let searchTimeout = null;
+let searchRequest = null;
 
-// Run function when key is pressed
-coursesSearchBar.addEventListener("keyup", filterFactory(coursesList,
-	// Filtering function
-	courseElement => {
-		const text = coursesSearchBar.value.toUpperCase();
-		// Show all elements if search bar is empty
-		if (!text) {
-			return false;
+// Replace rows of search results table with results
+function showSearchResults(results) {
+	const rows = results.map(result => {
+		const row = document.createElement("tr");
+		row.className = "courses-list-row";
+		row.addEventListener("click", () => window.location = result.link);
+		for (const text of [result.course_id, result.name]) {
+			const cell = document.createElement("td");
+			cell.textContent = text;
+			row.appendChild(cell);
 		}
-		const label = courseElement.querySelector(".courses-row-id");
-		const courseCode = label.textContent || label.innerText;
-		// Show element if search bar text appears anywhere in course code
-		return courseCode.toUpperCase().indexOf(text) <= -1;
-	},
-	// Show element function
-	courseElement => {
-		courseElement.style.display = "";
-	},
-	// Hide element function
-	courseElement => {
-		courseElement.style.display = "none";
+		return row;
+	});
+	searchResultsBody.replaceChildren(...rows);
+}
+
+// Search courses on server, showing course list again if search bar is empty
+function searchCourses() {
+	const text = coursesSearchBar.value.trim();
+	if (searchRequest) {
+		searchRequest.abort();
+		searchRequest = null;
+	}
+	if (!text) {
+		searchResults.hidden = true;
+		coursesListPage.hidden = false;
+		return;
 	}
-));
+	searchRequest = new AbortController();
+	fetch("/api/search?" + new URLSearchParams({q: text}), {signal: searchRequest.signal})
+		.then(response => response.json())
+		.then(data => {
+			showSearchResults(data.results);
+			coursesListPage.hidden = true;
+			searchResults.hidden = false;
+		})
+		.catch(error => {
+			// Searches replaced by a newer search are aborted
+			if (error.name !== "AbortError") {
+				console.error(error);
+			}
+		});
+}
+
+// Run search once user stops typing
+coursesSearchBar.addEventListener("input", () => {
+	clearTimeout(searchTimeout);
+	searchTimeout = setTimeout(searchCourses, SEARCH_DELAY);
+});
+// Prevent search form from reloading page
+coursesSearchBar.form.addEventListener("submit", event => event.preventDefault());